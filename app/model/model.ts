@@ -19,6 +19,7 @@ export interface ModelMetadata {
   version: string;
   vocab_size: number;
   max_length: number;
+  tokenizer?: { type: 'vocabulary' } | { type: 'hash'; hash: 'fnv1a32'; buckets: number; offset: number };
   inputs: any;
   outputs: any;
   temporal_normalization: any;
@@ -132,12 +133,24 @@ export class IntentProcessor {
     const padTokenId = 0;
     const unkTokenId = 1;
 
-    const indices = tokens.map(t => this.vocabulary[t] ?? unkTokenId);
+    const tokenizer = this.metadata?.tokenizer;
+    const indices = tokenizer?.type === 'hash'
+      ? tokens.map(t => tokenizer.offset + (this.fnv1a32(t) % tokenizer.buckets))
+      : tokens.map(t => this.vocabulary[t] ?? unkTokenId);
     return indices.length < maxLength
       ? [...indices, ...Array(maxLength - indices.length).fill(padTokenId)]
       : indices.slice(0, maxLength);
   }
 
+  /** 32-bit FNV-1a hash of the token's UTF-8 bytes (same as weather_model/tokens.py) */
+  private fnv1a32(token: string): number {
+    let hash = 0x811c9dc5;
+    for (const byte of new TextEncoder().encode(token)) {
+      hash = Math.imul(hash ^ byte, 0x01000193) >>> 0;
+    }
+    return hash;
+  }
+
   private denormalizeDayOffset(n: number) { return Math.round(n * 6); }
   private denormalizeHourOfDay(n: number) { return Math.round(n * 23); }
   private denormalizeDayDuration(n: number) { return Math.round(n * 7); }
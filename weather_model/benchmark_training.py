@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import torch
+from model import create_model
+from train import IntentTrainer, PRECISIONS, add_data_arguments, make_loaders
+from config import BASE_DIR
+
+# Training configurations: a precision, optionally with '+compile'
+CONFIGS = [precision + suffix for suffix in ('', '+compile') for precision in PRECISIONS]
+
+def run(config, args, metadata, device):
+    """Train a fresh model (same seed and batch order for every config), timing each epoch"""
+    precision, _, compile_model = config.partition('+')
+    torch.manual_seed(args.seed)
+    train_loader, test_loader = make_loaders(args, metadata)
+    model = create_model(
+        vocab_size=metadata['vocab_size'],
+        num_intent=len(metadata['intent_classes']),
+        num_sub_intent=len(metadata['sub_intent_classes']),
+        num_timeframe=len(metadata['timeframe_classes']),
+        num_forecast=len(metadata['forecast_classes'])
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trainer = IntentTrainer(model, device=device, checkpoint_path=os.path.join(tmp, 'model.pt'),
+                                precision=precision, compile_model=bool(compile_model))
+        print(f"\n=== {config} ===")
+        trainer.train(train_loader, test_loader, epochs=args.epochs, early_stop_patience=args.epochs)
+        metrics = trainer.evaluate(test_loader)
+
+    # The first epoch pays for warm-up, and for compilation in compiled configs
+    seconds = trainer.history['epoch_seconds']
+    steady = statistics.median(seconds[1:]) if len(seconds) > 1 else seconds[0]
+    throughput = trainer.history['samples_per_sec'][1:] or trainer.history['samples_per_sec']
+    return {
+        'first_epoch_sec': seconds[0],
+        'epoch_sec': steady,
+        'samples_per_sec': statistics.median(throughput),
+        **metrics
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare training speed and accuracy across precisions and torch.compile')
+    add_data_arguments(parser)
+    parser.add_argument('--configs', nargs='+', choices=CONFIGS, default=['fp32', 'bf16', 'fp32+compile'])
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Load metadata
+    with open(BASE_DIR/'model_artifacts/model_metadata.json', 'r') as f:
+        metadata = json.load(f)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    results = {config: run(config, args, metadata, device) for config in args.configs}
+
+    # Everything relative to the first config listed
+    baseline = args.configs[0]
+    print(f"\n=== Training Benchmark ({args.epochs} epochs, relative to {baseline}) ===")
+    for metric in results[baseline]:
+        fmt = '.4f' if metric.endswith('_acc') or metric.endswith('_mae') or metric == 'loss' else '.1f'
+        cells = []
+        for config, result in results.items():
+            value, base = result[metric], results[baseline][metric]
+            if config == baseline:
+                cells.append(f"{config} {value:{fmt}}")
+            elif metric in ('samples_per_sec', 'epoch_sec', 'first_epoch_sec'):
+                cells.append(f"{config} {value:{fmt}} ({value / base:.2f}x)")
+            else:
+                cells.append(f"{config} {value:{fmt}} ({value - base:+.4f})")
+        print(f"{metric:>16}: " + ' | '.join(cells))
+
+    # Compilation pays off once its one-off cost is won back by faster epochs
+    for config, result in results.items():
+        eager = config.split('+')[0]
+        if not config.endswith('+compile') or eager not in results:
+            continue
+        overhead = (result['first_epoch_sec'] - result['epoch_sec']) - (
+            results[eager]['first_epoch_sec'] - results[eager]['epoch_sec'])
+        saved = results[eager]['epoch_sec'] - result['epoch_sec']
+        speedup = results[eager]['epoch_sec'] / result['epoch_sec']
+        break_even = f"{overhead / saved:.1f} epochs" if saved > 0 else 'never'
+        print(f"\n{config} vs {eager}: compile overhead {overhead:.1f}s, steady-state speedup "
+              f"{speedup:.2f}x, breaks even after {break_even}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# intent_model/columnar.py
+"""
+Columnar on-disk datasets: one .npy file per column plus a small JSON manifest
+
+Numeric columns are plain .npy arrays, so readers can np.load(..., mmap_mode='r') them
+without parsing or copying. Columns are written by appending chunks, so writers never
+need the whole dataset in memory.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+
+MANIFEST = 'manifest.json'
+CORPUS_FORMAT = 'intent-corpus'
+
+class NpyAppender:
+    """Append chunks to a .npy file whose final length is unknown until close()"""
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self._part_path = self.path.with_name(self.path.name + '.part')
+        self._part = open(self._part_path, 'wb')
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._part.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self):
+        """Write the .npy header for the final shape, followed by the appended data"""
+        self._part.close()
+        header = {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (self.rows,) + self.row_shape,
+        }
+        with open(self.path, 'wb') as out:
+            np.lib.format.write_array_header_1_0(out, header)
+            with open(self._part_path, 'rb') as part:
+                shutil.copyfileobj(part, out, 16 * 1024 * 1024)
+        os.remove(self._part_path)
+
+    def abort(self):
+        """Discard the appended data without writing the .npy file"""
+        self._part.close()
+        os.remove(self._part_path)
+
+def write_manifest(dirname, manifest: dict):
+    with open(Path(dirname) / MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def read_manifest(dirname) -> dict:
+    with open(Path(dirname) / MANIFEST, 'r') as f:
+        return json.load(f)
+
+def is_columnar(path) -> bool:
+    """True if path is a directory written by this module"""
+    return (Path(path) / MANIFEST).is_file()
+
+def encode_text(values) -> np.ndarray:
+    """Newline-terminated UTF-8 bytes of a list of strings (newlines inside values become spaces)"""
+    text = ''.join(value.replace('\n', ' ') + '\n' for value in values)
+    return np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+
+def decode_text(data: np.ndarray) -> list:
+    """Inverse of encode_text, decoding the whole column in one pass"""
+    text = data.tobytes().decode('utf-8')
+    return text.split('\n')[:-1]
+
+def decode_lines(data: np.ndarray, start: int, count: int, window=1 << 20):
+    """
+    Decode the next count newline-terminated values of a text column from byte offset start
+    Returns (values, next_start); only the bytes of those values are read
+    """
+    end = start
+    while True:
+        stop = min(start + window, len(data))
+        newlines = np.flatnonzero(np.asarray(data[start:stop]) == ord('\n'))
+        if len(newlines) >= count or stop == len(data):
+            end = start + (int(newlines[count - 1]) + 1 if len(newlines) >= count else stop - start)
+            break
+        window *= 2
+    return decode_text(data[start:end]), end
+
+class CorpusWriter:
+    """
+    Streaming writer for a training corpus directory
+
+    Text columns are stored as newline-terminated UTF-8 bytes, categorical columns as
+    dictionary-encoded int16 codes (dictionary in the manifest), integer columns with the
+    dtype given in the schema.
+    """
+
+    def __init__(self, dirname, schema: dict):
+        self.dirname = Path(dirname)
+        self.dirname.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.rows = 0
+        self.categories = {name: {} for name, kind in schema.items() if kind == 'category'}
+        self.columns = {}
+        for name, kind in schema.items():
+            dtype = {'text': np.uint8, 'category': np.int16}.get(kind, kind)
+            self.columns[name] = NpyAppender(self.dirname / f'{name}.npy', dtype)
+
+    def write(self, rows: list):
+        """Append a chunk of row dicts"""
+        for name, kind in self.schema.items():
+            values = [row[name] for row in rows]
+            if kind == 'text':
+                self.columns[name].append(encode_text(values))
+            elif kind == 'category':
+                dictionary = self.categories[name]
+                codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+                self.columns[name].append(codes)
+            else:
+                self.columns[name].append([int(value) for value in values])
+        self.rows += len(rows)
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+        write_manifest(self.dirname, {
+            'format': CORPUS_FORMAT,
+            'version': 1,
+            'num_rows': self.rows,
+            'columns': {
+                name: {
+                    'file': f'{name}.npy',
+                    'kind': kind if kind in ('text', 'category') else 'int',
+                    **({'categories': list(self.categories[name])} if kind == 'category' else {}),
+                }
+                for name, kind in self.schema.items()
+            },
+        })
+
+    def abort(self):
+        """Discard a partial corpus: no column files and no manifest are written"""
+        for column in self.columns.values():
+            column.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # A failed or interrupted run must not leave a valid-looking truncated corpus
+        if exc[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+def load_corpus(dirname, mmap_mode='r') -> dict:
+    """
+    Load a corpus directory
+
+    Returns {column: array}; text columns are decoded to lists of str, categorical columns
+    come back as (codes, categories) tuples with memory-mapped codes, and integer columns
+    are memory-mapped arrays.
+    """
+    dirname = Path(dirname)
+    manifest = read_manifest(dirname)
+    if manifest.get('format') != CORPUS_FORMAT:
+        raise ValueError(f"{dirname} is not a training corpus (format={manifest.get('format')})")
+
+    columns = {}
+    for name, spec in manifest['columns'].items():
+        data = np.load(dirname / spec['file'], mmap_mode=mmap_mode)
+        if spec['kind'] == 'text':
+            columns[name] = decode_text(data)
+        elif spec['kind'] == 'category':
+            columns[name] = (data, spec['categories'])
+        else:
+            columns[name] = data
+    return columns
+
+def iter_corpus(dirname, chunk_size=100000, mmap_mode='r'):
+    """Chunked load_corpus: yields the same {column: array} layout for chunk_size rows at a time"""
+    dirname = Path(dirname)
+    manifest = read_manifest(dirname)
+    if manifest.get('format') != CORPUS_FORMAT:
+        raise ValueError(f"{dirname} is not a training corpus (format={manifest.get('format')})")
+
+    specs = manifest['columns']
+    data = {name: np.load(dirname / spec['file'], mmap_mode=mmap_mode) for name, spec in specs.items()}
+    text_start = {name: 0 for name, spec in specs.items() if spec['kind'] == 'text'}
+    for start in range(0, manifest['num_rows'], chunk_size):
+        stop = min(start + chunk_size, manifest['num_rows'])
+        columns = {}
+        for name, spec in specs.items():
+            if spec['kind'] == 'text':
+                columns[name], text_start[name] = decode_lines(data[name], text_start[name], stop - start)
+            elif spec['kind'] == 'category':
+                columns[name] = (np.asarray(data[name][start:stop]), spec['categories'])
+            else:
+                columns[name] = np.asarray(data[name][start:stop])
+        yield columns
+
+DATASET_FORMAT = 'intent-dataset'
+
+def dataset_entry(name, dtype, shape) -> dict:
+    return {'file': f'{name}.npy', 'dtype': np.dtype(dtype).str, 'shape': list(shape)}
+
+def save_arrays(dirname, arrays: dict, **meta):
+    """Save a dict of arrays as one .npy file per entry plus a manifest"""
+    dirname = Path(dirname)
+    dirname.mkdir(parents=True, exist_ok=True)
+    entries = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(dirname / f'{name}.npy', array)
+        entries[name] = dataset_entry(name, array.dtype, array.shape)
+    write_manifest(dirname, {'format': DATASET_FORMAT, 'version': 1, 'arrays': entries, **meta})
+
+class DatasetWriter:
+    """Streaming counterpart of save_arrays: each array is built by appending chunks"""
+
+    def __init__(self, dirname, dtypes: dict, **meta):
+        self.dirname = Path(dirname)
+        self.dirname.mkdir(parents=True, exist_ok=True)
+        self.meta = meta
+        self.arrays = {name: NpyAppender(self.dirname / f'{name}.npy', dtype) for name, dtype in dtypes.items()}
+
+    def append(self, name, values):
+        self.arrays[name].append(values)
+
+    def close(self):
+        entries = {}
+        for name, array in self.arrays.items():
+            array.close()
+            entries[name] = dataset_entry(name, array.dtype, (array.rows,) + array.row_shape)
+        write_manifest(self.dirname, {'format': DATASET_FORMAT, 'version': 1, 'arrays': entries, **self.meta})
+
+    def abort(self):
+        """Discard a partial dataset: no array files and no manifest are written"""
+        for array in self.arrays.values():
+            array.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # Same guard as CorpusWriter: never publish a manifest over partial arrays
+        if exc[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+def load_arrays(dirname, mmap_mode='r') -> dict:
+    """Open every array listed in a dataset manifest (memory-mapped by default)"""
+    dirname = Path(dirname)
+    manifest = read_manifest(dirname)
+    if manifest.get('format') != DATASET_FORMAT:
+        raise ValueError(f"{dirname} is not a preprocessed dataset (format={manifest.get('format')})")
+    return {
+        name: np.load(dirname / entry['file'], mmap_mode=mmap_mode)
+        for name, entry in manifest['arrays'].items()
+    }
+
+def narrowest_int(values) -> np.dtype:
+    """Smallest integer dtype that holds every value"""
+    values = np.asarray(values)
+    if values.size == 0:
+        return np.dtype(np.uint8)
+    return np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+
+def take_ragged(values, offsets, indices):
+    """
+    Gather rows of a ragged array (row i is values[offsets[i]:offsets[i + 1]])
+    Returns (values, offsets) of the selected rows, in the order of indices
+    """
+    indices = np.asarray(indices)
+    starts = np.asarray(offsets[indices])
+    lengths = np.asarray(offsets[indices + 1]) - starts
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1], lengths)
+    return values[np.repeat(starts, lengths) + positions], new_offsets
+
+def pad_ragged(values, offsets, indices=None, width=None, dtype=np.int64) -> np.ndarray:
+    """
+    Zero-padded [len(indices), width] matrix of ragged rows (all rows if indices is None)
+    width defaults to the longest selected row; longer rows are truncated
+    """
+    if indices is None:
+        indices = np.arange(len(offsets) - 1)
+    indices = np.asarray(indices)
+    starts = np.asarray(offsets[indices])
+    lengths = np.asarray(offsets[indices + 1]) - starts
+    if width is None:
+        width = max(int(lengths.max(initial=0)), 1)
+    lengths = np.minimum(lengths, width)
+
+    rows = np.repeat(np.arange(len(indices)), lengths)
+    positions = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    padded = np.zeros((len(indices), width), dtype=dtype)
+    padded[rows, positions] = values[np.repeat(starts, lengths) + positions]
+    return padded
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import torch
+from model import create_model, BACKBONES
+from train import IntentTrainer, add_data_arguments, make_loaders
+from export_onnx import export_to_onnx
+from config import BASE_DIR, MODEL_BACKBONE, MODEL_CHECKPOINT
+
+# Layers reading the shared features: their input columns follow shared_fc's kept units
+HEAD_LAYERS = ['intent_head', 'sub_intent_head', 'timeframe_head', 'forecast_head', 'regression_head.hidden']
+
+def top_units(scores, k):
+    """Indices of the k highest-scoring units, in their original order"""
+    return torch.sort(torch.topk(scores, k).indices).values
+
+def prune_linear(state, name, rows=None, cols=None):
+    """Keep the given output units (rows) and input features (cols) of a Linear layer"""
+    weight = state[f'{name}.weight']
+    if rows is not None:
+        weight = weight[rows]
+        state[f'{name}.bias'] = state[f'{name}.bias'][rows]
+    if cols is not None:
+        weight = weight[:, cols]
+    state[f'{name}.weight'] = weight
+
+def prune_linear_units(state, name, k, cols=None):
+    """Keep the k output units of a Linear layer with the largest incoming L1 norm"""
+    rows = top_units(state[f'{name}.weight'].abs().sum(dim=1), k)
+    prune_linear(state, name, rows, cols)
+    return rows
+
+def prune_lstm(state, embed_keep, hidden):
+    """
+    Keep hidden // 2 units per direction in every LSTM layer (largest L1 norm over the
+    unit's four gate rows), slicing recurrent and next-layer inputs to match
+    Returns the kept indices of the last layer's output
+    """
+    h = state['lstm.weight_hh_l0'].shape[1]
+    inputs = embed_keep
+    layer = 0
+    while f'lstm.weight_ih_l{layer}' in state:
+        outputs = []
+        for direction, suffix in enumerate(['', '_reverse']):
+            w_ih = state[f'lstm.weight_ih_l{layer}{suffix}']
+            w_hh = state[f'lstm.weight_hh_l{layer}{suffix}']
+            scores = (w_ih.abs().sum(dim=1) + w_hh.abs().sum(dim=1)).view(4, h).sum(dim=0)
+            units = top_units(scores, hidden // 2)
+            gate_rows = torch.cat([gate * h + units for gate in range(4)])
+    
+            state[f'lstm.weight_ih_l{layer}{suffix}'] = w_ih[gate_rows][:, inputs]
+            state[f'lstm.weight_hh_l{layer}{suffix}'] = w_hh[gate_rows][:, units]
+            for bias in ('bias_ih', 'bias_hh'):
+                state[f'lstm.{bias}_l{layer}{suffix}'] = state[f'lstm.{bias}_l{layer}{suffix}'][gate_rows]
+            outputs.append(direction * h + units)
+        inputs = torch.cat(outputs)
+        layer += 1
+    
+    # Attention pooling reads the LSTM output and scores it through a hidden layer
+    attention_rows = prune_linear_units(state, 'attention.0', hidden, cols=inputs)
+    prune_linear(state, 'attention.2', cols=attention_rows)
+    return inputs
+
+def prune_cnn(state, embed_keep, hidden):
+    """Keep the hidden channels of each convolution with the largest L1 norm"""
+    inputs = embed_keep
+    index = 0
+    while f'convs.{index}.weight' in state:
+        weight = state[f'convs.{index}.weight']  # [out, in, kernel]
+        channels = top_units(weight.abs().sum(dim=(1, 2)), hidden)
+        state[f'convs.{index}.weight'] = weight[channels][:, inputs]
+        state[f'convs.{index}.bias'] = state[f'convs.{index}.bias'][channels]
+        inputs = channels
+        index += 1
+    return inputs
+
+def prune_bag(state, embed_keep, hidden):
+    return prune_linear_units(state, 'bag_proj.0', hidden, cols=embed_keep)
+
+def prune_state_dict(state_dict, backbone, embed_dim, hidden_dim):
+    """
+    Structured pruning of an IntentClassifier state dict to smaller embed_dim/hidden_dim
+    
+    Units are ranked by L1 weight norm and sliced out whole, so the result loads into a
+    plain create_model(..., embed_dim=embed_dim, hidden_dim=hidden_dim) with no masks.
+    """
+    state = dict(state_dict)
+    
+    # Embedding dimensions with the largest L1 norm over the vocabulary
+    embedding = state['embedding.weight']
+    embed_keep = top_units(embedding.abs().sum(dim=0), embed_dim)
+    state['embedding.weight'] = embedding[:, embed_keep]
+    
+    encoded = {'lstm': prune_lstm, 'cnn': prune_cnn, 'bag': prune_bag}[backbone](state, embed_keep, hidden_dim)
+    
+    # Shared feature layers, then the heads reading them
+    first = prune_linear_units(state, 'shared_fc.0', hidden_dim, cols=encoded)
+    shared = prune_linear_units(state, 'shared_fc.3', hidden_dim, cols=first)
+    for name in HEAD_LAYERS:
+        prune_linear(state, name, cols=shared)
+    return state
+
+def onnx_latency(path, max_length, runs=500):
+    """Median single-query latency (ms) of an ONNX model in ONNX Runtime"""
+    import onnxruntime as ort
+    session = ort.InferenceSession(str(path), providers=['CPUExecutionProvider'])
+    input_ids = np.zeros((1, max_length), dtype=np.int64)
+    input_ids[0, :min(6, max_length)] = np.arange(2, 2 + min(6, max_length))
+    
+    for _ in range(50):
+        session.run(None, {'input_ids': input_ids})
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, {'input_ids': input_ids})
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description='Prune a trained intent classifier and report accuracy vs latency')
+    add_data_arguments(parser)
+    parser.add_argument('--checkpoint', default=MODEL_CHECKPOINT)
+    parser.add_argument('--backbone', choices=BACKBONES, default=MODEL_BACKBONE)
+    parser.add_argument('--levels', type=float, nargs='+', default=[0.75, 0.5, 0.25, 0.125],
+                        help='Fractions of embedding and hidden units to keep, each in (0, 1] '
+                             '(the unpruned model, 1.0, is always included)')
+    parser.add_argument('--finetune-epochs', type=int, default=3)
+    parser.add_argument('--output', default=str(BASE_DIR/'model_artifacts/compressed'),
+                        help='Directory for the pruned checkpoints, ONNX files and report.json')
+    args = parser.parse_args()
+    if not all(0 < level <= 1 for level in args.levels):
+        parser.error(f"--levels must be in (0, 1], got {args.levels}")
+    
+    # Load metadata
+    with open(BASE_DIR/'model_artifacts/model_metadata.json', 'r') as f:
+        metadata = json.load(f)
+    
+    train_loader, test_loader = make_loaders(args, metadata)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    
+    def build(embed_dim=128, hidden_dim=256):
+        return create_model(
+            vocab_size=metadata['vocab_size'],
+            num_intent=len(metadata['intent_classes']),
+            num_sub_intent=len(metadata['sub_intent_classes']),
+            num_timeframe=len(metadata['timeframe_classes']),
+            num_forecast=len(metadata['forecast_classes']),
+            backbone=args.backbone,
+            embed_dim=embed_dim,
+            hidden_dim=hidden_dim
+        )
+    
+    base = build()
+    base.load_state_dict(torch.load(args.checkpoint, map_location='cpu'))
+    base_state = base.state_dict()
+    embed_dim = base.embedding.embedding_dim
+    hidden_dim = base.shared_fc[0].out_features
+    
+    report = []
+    for level in sorted({1.0, *args.levels}, reverse=True):
+        name = f'level-{level:g}'
+        level_dir = os.path.join(args.output, name)
+        os.makedirs(level_dir, exist_ok=True)
+        print(f"\n=== {name} ===")
+    
+        if level == 1.0:
+            model = base
+            trainer = IntentTrainer(model, device=device, checkpoint_path=os.path.join(level_dir, 'model.pt'))
+            torch.save(model.state_dict(), trainer.checkpoint_path)
+        else:
+            level_embed = max(1, round(embed_dim * level))
+            level_hidden = max(2, 2 * round(hidden_dim * level / 2))  # even: split across LSTM directions
+            model = build(level_embed, level_hidden)
+            model.load_state_dict(prune_state_dict(base_state, args.backbone, level_embed, level_hidden))
+            trainer = IntentTrainer(model, device=device, checkpoint_path=os.path.join(level_dir, 'model.pt'))
+            if args.finetune_epochs > 0:
+                trainer.train(train_loader, test_loader, epochs=args.finetune_epochs)
+            else:
+                torch.save(model.state_dict(), trainer.checkpoint_path)
+    
+        metrics = trainer.evaluate(test_loader)
+        model.cpu()
+        onnx_path = export_to_onnx(
+            model,
+            vocab_size=metadata['vocab_size'],
+            max_length=metadata['max_length'],
+            output_path=os.path.join(level_dir, 'intent_model.onnx')
+        )
+        report.append({
+            'level': level,
+            'embed_dim': model.embedding.embedding_dim,
+            'hidden_dim': model.shared_fc[0].out_features,
+            'parameters': sum(p.numel() for p in model.parameters()),
+            'onnx_bytes': os.path.getsize(onnx_path),
+            'onnx_latency_ms': onnx_latency(onnx_path, metadata['max_length']),
+            **metrics
+        })
+    
+    with open(os.path.join(args.output, 'report.json'), 'w') as f:
+        json.dump({'backbone': args.backbone, 'checkpoint': str(args.checkpoint), 'levels': report}, f, indent=2)
+    
+    # Summary table
+    metric_names = [key for key in report[0] if key.endswith('_acc') or key.endswith('_mae')]
+    header = ['level', 'embed', 'hidden', 'params', 'onnx KB', 'latency ms'] + metric_names
+    print("\n=== Compression Report ===")
+    print(' | '.join(header))
+    for row in report:
+        cells = [
+            f"{row['level']:g}", str(row['embed_dim']), str(row['hidden_dim']), f"{row['parameters']:,}",
+            f"{row['onnx_bytes'] / 1024:.0f}", f"{row['onnx_latency_ms']:.3f}"
+        ] + [f"{row[key]:.4f}" for key in metric_names]
+        print(' | '.join(cells))
+    print(f"\nSaved report to {os.path.join(args.output, 'report.json')}")
+
+if __name__ == "__main__":
+    main()
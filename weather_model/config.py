@@ -1,4 +1,5 @@
 # intent_model/config.py
+import os
 from pathlib import Path
 
 # Always resolves relative to this file
@@ -6,3 +7,14 @@ BASE_DIR = Path(__file__).resolve().parent
 
 INTENT_KEYWORDS = BASE_DIR / "intent_keywords.json"
 TIMEFRAME_KEYWORDS = BASE_DIR / "timeframe_keywords.json"
+
+# Encoder in front of the shared heads: 'lstm' (BiLSTM + attention), 'cnn' or 'bag'
+# (mean of embeddings); train, export and the tester must use the same one
+MODEL_BACKBONE = os.environ.get("INTENT_MODEL_BACKBONE", "lstm")
+
+# Model weights written by train.py / distill.py and read by export_onnx.py and the tester
+MODEL_CHECKPOINT = os.environ.get("INTENT_MODEL_CHECKPOINT", "best_model.pt")
+
+# Embedding table of exported / inference models: 'float32' or 'int8' (per-row quantized);
+# training always uses float32
+EMBEDDING_STORAGE = os.environ.get("INTENT_EMBEDDING_STORAGE", "float32")
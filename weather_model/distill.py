@@ -0,0 +1,125 @@
+import argparse
+import json
+import time
+import numpy as np
+import torch
+from model import create_model, load_model, DistillationLoss, BACKBONES
+from train import IntentTrainer, add_data_arguments, make_loaders
+from config import BASE_DIR, MODEL_CHECKPOINT
+
+class DistillationTrainer(IntentTrainer):
+    """
+    IntentTrainer for a student model learning from a frozen teacher
+    
+    Training batches are also run through the teacher and optimized with DistillationLoss;
+    validation (loss, metrics, early stopping) uses the plain IntentLoss on the true
+    labels, so the numbers are directly comparable with the teacher's.
+    """
+    def __init__(self, model, teacher, device='cpu', checkpoint_path='student_model.pt',
+                 temperature=2.0, alpha=0.5):
+        super().__init__(model, device=device, checkpoint_path=checkpoint_path)
+        self.teacher = teacher.to(device).eval()
+        for param in self.teacher.parameters():
+            param.requires_grad_(False)
+        self.distillation_loss = DistillationLoss(temperature=temperature, alpha=alpha)
+    
+    def training_losses(self, X, outputs, targets):
+        with torch.no_grad():
+            teacher_outputs = self.teacher(X)
+        return self.distillation_loss(outputs, targets, teacher_outputs)
+
+def build_model(metadata, backbone, embed_dim=128, hidden_dim=256):
+    return create_model(
+        vocab_size=metadata['vocab_size'],
+        num_intent=len(metadata['intent_classes']),
+        num_sub_intent=len(metadata['sub_intent_classes']),
+        num_timeframe=len(metadata['timeframe_classes']),
+        num_forecast=len(metadata['forecast_classes']),
+        backbone=backbone,
+        embed_dim=embed_dim,
+        hidden_dim=hidden_dim
+    )
+
+def model_latency(model, max_length, runs=500):
+    """Median single-query CPU latency (ms) of a model in eval mode"""
+    model = model.cpu().eval()
+    input_ids = torch.zeros((1, max_length), dtype=torch.long)
+    input_ids[0, :min(6, max_length)] = torch.arange(2, 2 + min(6, max_length))
+    
+    timings = []
+    with torch.no_grad():
+        for _ in range(50):
+            model(input_ids)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(input_ids)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill a trained intent classifier into a smaller student')
+    add_data_arguments(parser)
+    parser.add_argument('--teacher', default=MODEL_CHECKPOINT,
+                        help=f'Teacher checkpoint (default: {MODEL_CHECKPOINT})')
+    parser.add_argument('--teacher-backbone', choices=BACKBONES, default='lstm')
+    parser.add_argument('--student-backbone', choices=BACKBONES, default='bag')
+    parser.add_argument('--student-embed-dim', type=int, default=64,
+                        help='Student embedding size (the teacher\'s is read from its checkpoint)')
+    parser.add_argument('--student-hidden-dim', type=int, default=128,
+                        help='Student hidden size (even for an lstm student)')
+    parser.add_argument('--output', default='student_model.pt', help='Student checkpoint')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--temperature', type=float, default=2.0,
+                        help='Softmax temperature applied to teacher and student logits')
+    parser.add_argument('--alpha', type=float, default=0.5,
+                        help='Weight of the hard-label loss (1 - alpha goes to the teacher targets)')
+    args = parser.parse_args()
+    if args.student_embed_dim < 1 or args.student_hidden_dim < 2:
+        parser.error("--student-embed-dim must be >= 1 and --student-hidden-dim >= 2")
+    if args.student_backbone == 'lstm' and args.student_hidden_dim % 2:
+        parser.error("--student-hidden-dim must be even for an lstm student (split across directions)")
+    
+    # Load metadata
+    with open(BASE_DIR/'model_artifacts/model_metadata.json', 'r') as f:
+        metadata = json.load(f)
+    
+    train_loader, test_loader = make_loaders(args, metadata)
+    
+    # Teacher and student
+    teacher = load_model(args.teacher, metadata, args.teacher_backbone)
+    student = build_model(metadata, args.student_backbone, args.student_embed_dim, args.student_hidden_dim)
+    
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    print("=== Teacher Test Set Evaluation ===")
+    teacher_metrics = IntentTrainer(teacher, device=device).evaluate(test_loader)
+    print(json.dumps(teacher_metrics, indent=2))
+    
+    # Distill
+    trainer = DistillationTrainer(
+        student, teacher, device=device, checkpoint_path=args.output,
+        temperature=args.temperature, alpha=args.alpha
+    )
+    trainer.train(train_loader, test_loader, epochs=args.epochs)
+    
+    # Final evaluation
+    print("\n=== Student Test Set Evaluation ===")
+    student_metrics = trainer.evaluate(test_loader)
+    print(json.dumps(student_metrics, indent=2))
+    
+    # Size and single-query latency (CPU, PyTorch) of both models
+    print("\n=== Teacher vs Student ===")
+    sizes = {}
+    for name, model, backbone in (('teacher', teacher, args.teacher_backbone),
+                                  ('student', student, args.student_backbone)):
+        sizes[name] = (sum(p.numel() for p in model.parameters()), model_latency(model, metadata['max_length']))
+        print(f"{name}: {backbone}, embed {model.embedding.embedding_dim}, hidden {model.shared_fc[0].out_features}, "
+              f"{sizes[name][0]:,} parameters, {sizes[name][1]:.3f} ms/query")
+    print(f"student/teacher: {sizes['student'][0] / sizes['teacher'][0]:.2f}x parameters, "
+          f"{sizes['teacher'][1] / sizes['student'][1]:.1f}x faster, "
+          f"intent_acc {student_metrics['intent_acc'] - teacher_metrics['intent_acc']:+.4f}")
+    
+    print("\nExport the student with:")
+    print(f"  INTENT_MODEL_BACKBONE={args.student_backbone} INTENT_MODEL_CHECKPOINT={args.output} python export_onnx.py")
+
+if __name__ == "__main__":
+    main()
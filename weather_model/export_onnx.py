@@ -3,15 +3,15 @@ import onnx
 import onnxruntime as ort
 import json
 import numpy as np
-from model import create_model
-from config import BASE_DIR
+from model import load_model, apply_embedding_storage
+from config import BASE_DIR, MODEL_CHECKPOINT, EMBEDDING_STORAGE
 
 def export_to_onnx(model, vocab_size, max_length=50, output_path=BASE_DIR/'model_artifacts/intent_model.onnx'):
     """Export PyTorch model to ONNX format"""
     model.eval()
     
-    # Create dummy input
-    dummy_input = torch.randint(0, vocab_size, (1, max_length), dtype=torch.long)
+    # Create dummy input (non-zero ids: 0 is padding)
+    dummy_input = torch.randint(1, vocab_size, (1, max_length), dtype=torch.long)
     
     # Export
     torch.onnx.export(
@@ -21,6 +21,8 @@ def export_to_onnx(model, vocab_size, max_length=50, output_path=BASE_DIR/'model
         export_params=True,
         opset_version=14,
         do_constant_folding=True,
+        # TorchScript exporter: it maps the packed LSTM to ONNX LSTM with sequence_lens
+        dynamo=False,
         input_names=['input_ids'],
         output_names=[
             'intent_logits',
@@ -123,6 +125,8 @@ def create_frontend_metadata(metadata_path=BASE_DIR/'model_artifacts/model_metad
         'model_file': 'intent_model.onnx',
         'vocab_size': metadata['vocab_size'],
         'max_length': metadata['max_length'],
+        'tokenizer': metadata.get('tokenizer', {'type': 'vocabulary'}),
+        'embedding_storage': EMBEDDING_STORAGE,
         
         'inputs': {
             'input_ids': {
@@ -235,18 +239,12 @@ def main():
     with open(BASE_DIR/'model_artifacts/model_metadata.json', 'r') as f:
         metadata = json.load(f)
     
-    # Create model
-    model = create_model(
-        vocab_size=metadata['vocab_size'],
-        num_intent=len(metadata['intent_classes']),
-        num_sub_intent=len(metadata['sub_intent_classes']),
-        num_timeframe=len(metadata['timeframe_classes']),
-        num_forecast=len(metadata['forecast_classes'])
-    )
-    
-    # Load trained weights
-    model.load_state_dict(torch.load('best_model.pt', map_location='cpu'))
-    print("Loaded trained model weights")
+    # Create model at the checkpoint's size and load the trained weights
+    model = load_model(MODEL_CHECKPOINT, metadata)
+    print(f"Loaded trained model weights (embed_dim {model.embedding.embedding_dim}, "
+          f"hidden_dim {model.shared_fc[0].out_features})")
+    apply_embedding_storage(model)
+    print(f"Embedding table stored as {EMBEDDING_STORAGE}")
     
     # Export to ONNX
     onnx_path = export_to_onnx(
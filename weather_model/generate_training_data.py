@@ -1,10 +1,37 @@
 import json
 import csv
 import random
+import hashlib
+import argparse
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from pathlib import Path
+from typing import List, Dict, Tuple, Iterable, Iterator
 import pendulum
 from config import INTENT_KEYWORDS, TIMEFRAME_KEYWORDS, BASE_DIR
+from columnar import CorpusWriter
+
+FIELDNAMES = [
+    'query', 'intent', 'sub_intent', 'timeframe_type',
+    'day_offset', 'hour_of_day', 'day_duration', 'hour_duration', 'forecast_type', 'count'
+]
+
+# Column kinds/dtypes of the columnar corpus format (see columnar.CorpusWriter)
+CORPUS_SCHEMA = {
+    'query': 'text',
+    'intent': 'category',
+    'sub_intent': 'category',
+    'timeframe_type': 'category',
+    'day_offset': 'int8',
+    'hour_of_day': 'int8',
+    'day_duration': 'int8',
+    'hour_duration': 'int16',
+    'forecast_type': 'category',
+    'count': 'int32',
+}
 
 def load_keywords():
     """Load intent and timeframe keywords from JSON files"""
@@ -14,9 +41,80 @@ def load_keywords():
         timeframe_data = json.load(f)
     return intent_data, timeframe_data
 
-def generate_timeframe_labels(query: str, timeframe_data: dict) -> Tuple[str, int, int, int, int]:
+class KeywordMatcher:
     """
-    Generate enhanced timeframe labels
+    Aho-Corasick automaton compiled once from an ordered keyword list
+
+    first_match(text) returns the (keyword, payload) of the earliest-listed keyword that
+    occurs anywhere in text (case-insensitive), i.e. the same answer as testing
+    `keyword.lower() in text.lower()` for each entry in order, in a single pass over text.
+    """
+    
+    def __init__(self, entries: List[Tuple[str, object]]):
+        self.entries = list(entries)
+        no_match = len(self.entries)
+        goto = [{}]
+        # Lowest entry index ending at this state or any of its suffix states
+        best = [no_match]
+        
+        for priority, (keyword, _) in enumerate(self.entries):
+            state = 0
+            for ch in keyword.lower():
+                if ch not in goto[state]:
+                    goto[state][ch] = len(goto)
+                    goto.append({})
+                    best.append(no_match)
+                state = goto[state][ch]
+            best[state] = min(best[state], priority)
+        
+        # Breadth-first pass: resolve failure links into a full transition table so
+        # matching is one dict lookup per character, and inherit suffix matches
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            best[state] = min(best[state], best[fail[state]])
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0)
+                queue.append(child)
+        
+        self.delta = delta
+        self.best = best
+    
+    def first_match(self, text: str):
+        """Return (keyword, payload) of the highest-priority keyword in text, or None"""
+        delta, best = self.delta, self.best
+        state = 0
+        found = best[0]  # An empty keyword matches everything
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            if best[state] < found:
+                found = best[state]
+                if found == 0:
+                    break
+        return self.entries[found] if found < len(self.entries) else None
+
+def build_timeframe_matcher(timeframe_data: dict) -> KeywordMatcher:
+    """Compile all timeframe keywords, in file order, with their timeframe type as payload"""
+    return KeywordMatcher([
+        (keyword, tf['type'])
+        for tf in timeframe_data['timeframes']
+        for keyword in tf['keywords']
+    ])
+
+def build_sub_intent_matcher(intent_obj: dict) -> KeywordMatcher:
+    """Compile the sub-intent keywords of one intent with the sub-intent name as payload"""
+    return KeywordMatcher([
+        (keyword, sub_intent_obj['name'])
+        for sub_intent_obj in intent_obj.get('sub_intents') or []
+        for keyword in sub_intent_obj['keywords']
+    ])
+
+def timeframe_keyword_labels(keyword: str, tf_type: str, now) -> Tuple[str, int, int, int, int]:
+    """
+    Labels implied by one matched timeframe keyword relative to reference time now
     Returns: (timeframe_type, day_offset, hour_of_day, day_duration, hour_duration)
     
     day_offset: 0-6 (which day from now)
@@ -24,197 +122,223 @@ def generate_timeframe_labels(query: str, timeframe_data: dict) -> Tuple[str, in
     day_duration: 0-7 (number of days)
     hour_duration: 1-168 (total hours)
     """
-    now = pendulum.now()
-    
     # Default values
     day_offset = 0
     hour_of_day = now.hour
     day_duration = 1
     hour_duration = 24
-    timeframe_type = 'none'
+    timeframe_type = tf_type
     
-    # Check each timeframe type
-    for tf in timeframe_data['timeframes']:
-        tf_type = tf['type']
-        for keyword in tf['keywords']:
-            if keyword.lower() in query.lower():
-                timeframe_type = tf_type
-                
-                if tf_type == 'absolute_day':
-                    if 'today' in keyword:
-                        day_offset = 0
-                        hour_of_day = 12  # Noon as default
-                        day_duration = 1
-                        hour_duration = 24
-                    elif 'tomorrow' in keyword:
-                        day_offset = 1
-                        hour_of_day = 12
-                        day_duration = 1
-                        hour_duration = 24
-                    elif 'yesterday' in keyword:
-                        day_offset = 0  # Treat as today for training
-                        hour_of_day = 12
-                        day_duration = 1
-                        hour_duration = 24
-                    elif 'day after tomorrow' in keyword:
-                        day_offset = 2
-                        hour_of_day = 12
-                        day_duration = 1
-                        hour_duration = 24
-                    elif any(day in keyword for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']):
-                        # Find next occurrence of that day
-                        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-                        for day in days:
-                            if day in keyword:
-                                target_day = days.index(day)
-                                current_day = now.day_of_week - 1
-                                days_ahead = (target_day - current_day) % 7
-                                if days_ahead == 0:
-                                    if 'next' in keyword:
-                                        days_ahead = 7
-                                    elif 'last' in keyword:
-                                        days_ahead = 0
-                                day_offset = min(days_ahead, 6)
-                                hour_of_day = 12
-                                day_duration = 1
-                                hour_duration = 24
-                                break
-                
-                elif tf_type == 'relative_day':
-                    if 'this week' in keyword:
-                        day_offset = 0
-                        hour_of_day = 12
-                        day_duration = 7
-                        hour_duration = 168
-                    elif 'next week' in keyword:
-                        day_offset = 7 % 7  # Capped at 6
-                        hour_of_day = 12
-                        day_duration = 7
-                        hour_duration = 168
-                    elif 'weekend' in keyword:
-                        # Days until Saturday
-                        current_day = now.day_of_week - 1
-                        days_until_sat = (5 - current_day) % 7
-                        if days_until_sat == 0 and now.hour > 12:
-                            days_until_sat = 7
-                        day_offset = min(days_until_sat, 6)
-                        hour_of_day = 12
-                        day_duration = 2
-                        hour_duration = 48
-                    elif 'next few days' in keyword or 'few days' in keyword or 'couple days' in keyword:
-                        day_offset = 0
-                        hour_of_day = 12
-                        day_duration = 3
-                        hour_duration = 72
-                    elif 'rest of the week' in keyword or 'end of the week' in keyword:
-                        current_day = now.day_of_week - 1
-                        days_left = 6 - current_day
-                        day_offset = 0
-                        hour_of_day = 12
-                        day_duration = min(days_left, 7)
-                        hour_duration = days_left * 24
-                    else:
-                        day_offset = 0
-                        hour_of_day = 12
-                        day_duration = 7
-                        hour_duration = 168
-                
-                elif tf_type == 'absolute_time':
-                    # Extract hour from keyword
-                    import re
-                    
-                    if 'noon' in keyword or '12:00' in keyword or '12 o' in keyword:
-                        day_offset = 0
-                        hour_of_day = 12
-                        day_duration = 0
-                        hour_duration = 1
-                    elif 'midnight' in keyword:
-                        day_offset = 1
-                        hour_of_day = 0
-                        day_duration = 0
-                        hour_duration = 1
-                    else:
-                        # Try to extract hour number
-                        hour_match = re.search(r'(\d{1,2})\s*(am|pm|:)', keyword.lower())
-                        if hour_match:
-                            hour = int(hour_match.group(1))
-                            if 'pm' in keyword.lower() and hour != 12:
-                                hour += 12
-                            elif 'am' in keyword.lower() and hour == 12:
-                                hour = 0
-                            
-                            # Determine if it's today or tomorrow
-                            if hour < now.hour:
-                                day_offset = 1
-                            else:
-                                day_offset = 0
-                            
-                            hour_of_day = hour
-                            day_duration = 0
-                            hour_duration = 1
-                        else:
-                            day_offset = 0
-                            hour_of_day = now.hour
-                            day_duration = 0
-                            hour_duration = 1
-                
-                elif tf_type == 'relative_time':
-                    if 'next hour' in keyword or 'in the next hour' in keyword:
-                        day_offset = 0
-                        hour_of_day = now.hour
-                        day_duration = 0
-                        hour_duration = 1
-                    elif 'next 3 hours' in keyword or 'next few hours' in keyword or 'couple hours' in keyword:
-                        day_offset = 0
-                        hour_of_day = now.hour
-                        day_duration = 0
-                        hour_duration = 3
-                    elif 'tonight' in keyword:
-                        day_offset = 0
-                        hour_of_day = 20  # 8 PM
-                        day_duration = 0
-                        hour_duration = 6
-                    elif 'this morning' in keyword or 'morning' in keyword or 'early morning' in keyword:
-                        day_offset = 0
-                        hour_of_day = 7
-                        day_duration = 0
-                        hour_duration = 5  # 7-12
-                    elif 'afternoon' in keyword or 'this afternoon' in keyword:
-                        day_offset = 0
-                        hour_of_day = 14
-                        day_duration = 0
-                        hour_duration = 5  # 12-17
-                    elif 'evening' in keyword or 'this evening' in keyword:
-                        day_offset = 0
-                        hour_of_day = 18
-                        day_duration = 0
-                        hour_duration = 4  # 18-22
-                    elif 'later today' in keyword:
-                        day_offset = 0
-                        hour_of_day = min(now.hour + 3, 23)
-                        day_duration = 0
-                        hour_duration = 6
-                    elif 'overnight' in keyword:
-                        day_offset = 0
-                        hour_of_day = 22
-                        day_duration = 0
-                        hour_duration = 8
-                    else:
-                        day_offset = 0
-                        hour_of_day = now.hour
-                        day_duration = 0
-                        hour_duration = 3
-                
-                else:  # none
-                    day_offset = 0
-                    hour_of_day = now.hour
+    if tf_type == 'absolute_day':
+        if 'today' in keyword:
+            day_offset = 0
+            hour_of_day = 12  # Noon as default
+            day_duration = 1
+            hour_duration = 24
+        elif 'tomorrow' in keyword:
+            day_offset = 1
+            hour_of_day = 12
+            day_duration = 1
+            hour_duration = 24
+        elif 'yesterday' in keyword:
+            day_offset = 0  # Treat as today for training
+            hour_of_day = 12
+            day_duration = 1
+            hour_duration = 24
+        elif 'day after tomorrow' in keyword:
+            day_offset = 2
+            hour_of_day = 12
+            day_duration = 1
+            hour_duration = 24
+        elif any(day in keyword for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']):
+            # Find next occurrence of that day
+            days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+            for day in days:
+                if day in keyword:
+                    target_day = days.index(day)
+                    current_day = now.day_of_week - 1
+                    days_ahead = (target_day - current_day) % 7
+                    if days_ahead == 0:
+                        if 'next' in keyword:
+                            days_ahead = 7
+                        elif 'last' in keyword:
+                            days_ahead = 0
+                    day_offset = min(days_ahead, 6)
+                    hour_of_day = 12
                     day_duration = 1
                     hour_duration = 24
-                
-                return timeframe_type, day_offset, hour_of_day, day_duration, hour_duration
+                    break
+        
+    elif tf_type == 'relative_day':
+        if 'this week' in keyword:
+            day_offset = 0
+            hour_of_day = 12
+            day_duration = 7
+            hour_duration = 168
+        elif 'next week' in keyword:
+            day_offset = 7 % 7  # Capped at 6
+            hour_of_day = 12
+            day_duration = 7
+            hour_duration = 168
+        elif 'weekend' in keyword:
+            # Days until Saturday
+            current_day = now.day_of_week - 1
+            days_until_sat = (5 - current_day) % 7
+            if days_until_sat == 0 and now.hour > 12:
+                days_until_sat = 7
+            day_offset = min(days_until_sat, 6)
+            hour_of_day = 12
+            day_duration = 2
+            hour_duration = 48
+        elif 'next few days' in keyword or 'few days' in keyword or 'couple days' in keyword:
+            day_offset = 0
+            hour_of_day = 12
+            day_duration = 3
+            hour_duration = 72
+        elif 'rest of the week' in keyword or 'end of the week' in keyword:
+            current_day = now.day_of_week - 1
+            days_left = 6 - current_day
+            day_offset = 0
+            hour_of_day = 12
+            day_duration = min(days_left, 7)
+            hour_duration = days_left * 24
+        else:
+            day_offset = 0
+            hour_of_day = 12
+            day_duration = 7
+            hour_duration = 168
+        
+    elif tf_type == 'absolute_time':
+        # Extract hour from keyword
+        import re
+            
+        if 'noon' in keyword or '12:00' in keyword or '12 o' in keyword:
+            day_offset = 0
+            hour_of_day = 12
+            day_duration = 0
+            hour_duration = 1
+        elif 'midnight' in keyword:
+            day_offset = 1
+            hour_of_day = 0
+            day_duration = 0
+            hour_duration = 1
+        else:
+            # Try to extract hour number
+            hour_match = re.search(r'(\d{1,2})\s*(am|pm|:)', keyword.lower())
+            if hour_match:
+                hour = int(hour_match.group(1))
+                if 'pm' in keyword.lower() and hour != 12:
+                    hour += 12
+                elif 'am' in keyword.lower() and hour == 12:
+                    hour = 0
+                    
+                # Determine if it's today or tomorrow
+                if hour < now.hour:
+                    day_offset = 1
+                else:
+                    day_offset = 0
+                    
+                hour_of_day = hour
+                day_duration = 0
+                hour_duration = 1
+            else:
+                day_offset = 0
+                hour_of_day = now.hour
+                day_duration = 0
+                hour_duration = 1
+        
+    elif tf_type == 'relative_time':
+        if 'next hour' in keyword or 'in the next hour' in keyword:
+            day_offset = 0
+            hour_of_day = now.hour
+            day_duration = 0
+            hour_duration = 1
+        elif 'next 3 hours' in keyword or 'next few hours' in keyword or 'couple hours' in keyword:
+            day_offset = 0
+            hour_of_day = now.hour
+            day_duration = 0
+            hour_duration = 3
+        elif 'tonight' in keyword:
+            day_offset = 0
+            hour_of_day = 20  # 8 PM
+            day_duration = 0
+            hour_duration = 6
+        elif 'this morning' in keyword or 'morning' in keyword or 'early morning' in keyword:
+            day_offset = 0
+            hour_of_day = 7
+            day_duration = 0
+            hour_duration = 5  # 7-12
+        elif 'afternoon' in keyword or 'this afternoon' in keyword:
+            day_offset = 0
+            hour_of_day = 14
+            day_duration = 0
+            hour_duration = 5  # 12-17
+        elif 'evening' in keyword or 'this evening' in keyword:
+            day_offset = 0
+            hour_of_day = 18
+            day_duration = 0
+            hour_duration = 4  # 18-22
+        elif 'later today' in keyword:
+            day_offset = 0
+            hour_of_day = min(now.hour + 3, 23)
+            day_duration = 0
+            hour_duration = 6
+        elif 'overnight' in keyword:
+            day_offset = 0
+            hour_of_day = 22
+            day_duration = 0
+            hour_duration = 8
+        else:
+            day_offset = 0
+            hour_of_day = now.hour
+            day_duration = 0
+            hour_duration = 3
+        
+    else:  # none
+        day_offset = 0
+        hour_of_day = now.hour
+        day_duration = 1
+        hour_duration = 24
     
-    # Default if no match
-    return 'none', 0, now.hour, 1, 24
+    return timeframe_type, day_offset, hour_of_day, day_duration, hour_duration
+
+class TimeframeLabeler:
+    """
+    Timeframe labeling against a fixed reference time
+
+    The labels depend only on the matched keyword and the reference time, so the
+    keyword -> (timeframe_type, day_offset, hour_of_day, day_duration, hour_duration)
+    table is computed once up front and labeling a query is a single matcher lookup.
+    Freezing the reference also keeps long runs consistent across hour/day boundaries.
+    """
+    
+    def __init__(self, timeframe_data: dict, reference=None):
+        self.reference = reference or pendulum.now()
+        self.default = ('none', 0, self.reference.hour, 1, 24)
+        self.matcher = KeywordMatcher([
+            (keyword, timeframe_keyword_labels(keyword, tf_type, self.reference))
+            for keyword, tf_type in build_timeframe_matcher(timeframe_data).entries
+        ])
+    
+    def label(self, query: str) -> Tuple[str, int, int, int, int]:
+        """Labels of the first keyword (in file order) contained in the query"""
+        match = self.matcher.first_match(query)
+        return match[1] if match else self.default
+
+def generate_timeframe_labels(query: str, timeframe_data: dict, reference=None,
+                              labeler: TimeframeLabeler = None) -> Tuple[str, int, int, int, int]:
+    """
+    Generate enhanced timeframe labels
+    Returns: (timeframe_type, day_offset, hour_of_day, day_duration, hour_duration)
+    
+    reference: time the labels are relative to (defaults to now)
+    labeler: prebuilt TimeframeLabeler; pass one in when labeling many queries,
+    otherwise the keyword table is rebuilt on every call
+    """
+    if labeler is None:
+        labeler = TimeframeLabeler(timeframe_data, reference)
+    return labeler.label(query)
+
 
 def generate_forecast_type(day_duration: int, hour_duration: int) -> str:
     """Determine forecast type based on duration"""
@@ -225,102 +349,230 @@ def generate_forecast_type(day_duration: int, hour_duration: int) -> str:
     else:
         return 'daily'
 
-def generate_synthetic_queries(intent_data: dict, timeframe_data: dict, count: int = 8000) -> List[Dict]:
-    """Generate comprehensive synthetic training data"""
-    training_data = []
-    
-    # Query templates for variety
-    templates = [
-        "{keyword} {timeframe}",
-        "what is the {keyword} {timeframe}",
-        "will there be {keyword} {timeframe}",
-        "how {keyword} will it be {timeframe}",
-        "{keyword} forecast {timeframe}",
-        "is it going to {keyword} {timeframe}",
-        "check {keyword} {timeframe}",
-        "show me {keyword} for {timeframe}",
-        "tell me about {keyword} {timeframe}",
-        "what's the {keyword} like {timeframe}",
-        "give me the {keyword} {timeframe}",
-        "any {keyword} {timeframe}",
-        "will it {keyword} {timeframe}",
-        "is there {keyword} {timeframe}",
-        "{timeframe} {keyword}",
-        "{keyword} {timeframe} please",
-        "can you check {keyword} {timeframe}",
-        "I want to know the {keyword} {timeframe}",
-    ]
+# Query templates for variety
+TEMPLATES = [
+    "{keyword} {timeframe}",
+    "what is the {keyword} {timeframe}",
+    "will there be {keyword} {timeframe}",
+    "how {keyword} will it be {timeframe}",
+    "{keyword} forecast {timeframe}",
+    "is it going to {keyword} {timeframe}",
+    "check {keyword} {timeframe}",
+    "show me {keyword} for {timeframe}",
+    "tell me about {keyword} {timeframe}",
+    "what's the {keyword} like {timeframe}",
+    "give me the {keyword} {timeframe}",
+    "any {keyword} {timeframe}",
+    "will it {keyword} {timeframe}",
+    "is there {keyword} {timeframe}",
+    "{timeframe} {keyword}",
+    "{keyword} {timeframe} please",
+    "can you check {keyword} {timeframe}",
+    "I want to know the {keyword} {timeframe}",
+]
+
+# Non-weather intents get a fifth of the share of weather intents
+CONVERSATIONAL_INTENTS = ['greetings', 'feedback', 'farewell', 'unknown']
+CONVERSATIONAL_WEIGHT = 0.2
+
+def make_row(query: str, intent: str, sub_intent: str, labeler: TimeframeLabeler, count: int = 1) -> Dict:
+    """Label one query and build its training row"""
+    timeframe_type, day_offset, hour_of_day, day_duration, hour_duration = labeler.label(query)
+    forecast_type = generate_forecast_type(day_duration, hour_duration)
     
+    return {
+        'query': query,
+        'intent': intent,
+        'sub_intent': sub_intent,
+        'timeframe_type': timeframe_type,
+        'day_offset': day_offset,
+        'hour_of_day': hour_of_day,
+        'day_duration': day_duration,
+        'hour_duration': hour_duration,
+        'forecast_type': forecast_type,
+        'count': count
+    }
+
+def iter_random_queries(intent_data: dict, timeframe_data: dict, count: int,
+                        rng, labeler: TimeframeLabeler) -> Iterator[Dict]:
+    """Original rejection sampler: uniform intents, most conversational draws discarded"""
     for _ in range(count):
         # Pick a random intent
-        intent_obj = random.choice(intent_data['intents'])
+        intent_obj = rng.choice(intent_data['intents'])
         intent = intent_obj['intent']
         
         # Skip non-weather intents for most synthetic data
-        if intent in ['greetings', 'feedback', 'farewell', 'unknown'] and random.random() < 0.8:
+        if intent in CONVERSATIONAL_INTENTS and rng.random() < 1 - CONVERSATIONAL_WEIGHT:
             continue
         
         # Pick sub_intent if available
         sub_intent = 'none'
-        if 'sub_intents' in intent_obj and intent_obj['sub_intents'] and random.random() > 0.2:
-            sub_intent_obj = random.choice(intent_obj['sub_intents'])
+        if 'sub_intents' in intent_obj and intent_obj['sub_intents'] and rng.random() > 0.2:
+            sub_intent_obj = rng.choice(intent_obj['sub_intents'])
             sub_intent = sub_intent_obj['name']
-            keyword = random.choice(sub_intent_obj['keywords'])
+            keyword = rng.choice(sub_intent_obj['keywords'])
         else:
-            keyword = random.choice(intent_obj['keywords']) if intent_obj['keywords'] else intent
+            keyword = rng.choice(intent_obj['keywords']) if intent_obj['keywords'] else intent
         
         # Pick a timeframe
-        timeframe_obj = random.choice(timeframe_data['timeframes'])
-        tf_keyword = random.choice(timeframe_obj['keywords'])
+        timeframe_obj = rng.choice(timeframe_data['timeframes'])
+        tf_keyword = rng.choice(timeframe_obj['keywords'])
         
         # Generate query variation
-        template = random.choice(templates)
+        template = rng.choice(TEMPLATES)
         query = template.format(keyword=keyword, timeframe=tf_keyword)
         
-        # Generate timeframe labels
-        timeframe_type, day_offset, hour_of_day, day_duration, hour_duration = generate_timeframe_labels(query, timeframe_data)
-        forecast_type = generate_forecast_type(day_duration, hour_duration)
-        
-        training_data.append({
-            'query': query,
-            'intent': intent,
-            'sub_intent': sub_intent,
-            'timeframe_type': timeframe_type,
-            'day_offset': day_offset,
-            'hour_of_day': hour_of_day,
-            'day_duration': day_duration,
-            'hour_duration': hour_duration,
-            'forecast_type': forecast_type
-        })
+        yield make_row(query, intent, sub_intent, labeler)
+
+def intent_quotas(intent_data: dict, count: int) -> List[int]:
+    """
+    Split count across intents in proportion to their weight (largest remainder method)
+
+    Weather intents weigh 1 and conversational intents CONVERSATIONAL_WEIGHT, the same
+    expected intent mix the rejection sampler produces, but the quotas always sum to count.
+    """
+    weights = [
+        CONVERSATIONAL_WEIGHT if obj['intent'] in CONVERSATIONAL_INTENTS else 1.0
+        for obj in intent_data['intents']
+    ]
+    shares = [count * w / sum(weights) for w in weights]
+    quotas = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i] - quotas[i], reverse=True)
+    for i in by_remainder[:count - sum(quotas)]:
+        quotas[i] += 1
+    return quotas
+
+def keyword_options(intent_obj: dict) -> Dict[Tuple[str, str], float]:
+    """
+    All (keyword, sub_intent) choices of one intent with the rejection sampler's probability
+
+    A sub-intent is taken with probability 0.8 (uniform sub-intent, then keyword), otherwise
+    a base keyword; intents without sub-intents always take a base keyword.
+    """
+    options = Counter()
+    sub_intents = intent_obj.get('sub_intents') or []
+    for sub_intent_obj in sub_intents:
+        for keyword in sub_intent_obj['keywords']:
+            options[keyword, sub_intent_obj['name']] += 0.8 / len(sub_intents) / len(sub_intent_obj['keywords'])
+    
+    base = 0.2 if sub_intents else 1.0
+    keywords = intent_obj['keywords'] or [intent_obj['intent']]
+    for keyword in keywords:
+        options[keyword, 'none'] += base / len(keywords)
+    return options
+
+def timeframe_options(timeframe_data: dict) -> Dict[str, float]:
+    """Every timeframe keyword with the rejection sampler's probability (uniform type, then keyword)"""
+    options = Counter()
+    timeframes = timeframe_data['timeframes']
+    for timeframe_obj in timeframes:
+        for keyword in timeframe_obj['keywords']:
+            options[keyword] += 1 / len(timeframes) / len(timeframe_obj['keywords'])
+    return options
+
+def apportion(total: int, weights: List[float], rng) -> List[int]:
+    """
+    Split total into integer parts proportional to weights
+
+    Systematic sampling over a shuffled order: each part is the floor or ceiling of its
+    exact share, its expected value is the share, and the parts always sum to total.
+    """
+    order = list(range(len(weights)))
+    rng.shuffle(order)
+    scale = total / sum(weights)
+    offset = rng.random()
+    parts = [0] * len(weights)
+    cumulative, previous = 0.0, 0
+    for position, i in enumerate(order):
+        cumulative += weights[i] * scale
+        upto = total if position == len(order) - 1 else int(cumulative + offset)
+        parts[i] = upto - previous
+        previous = upto
+    return parts
+
+def iter_stratified_queries(intent_data: dict, timeframe_data: dict, count: int,
+                            rng, labeler: TimeframeLabeler) -> Iterator[Dict]:
+    """
+    Draw exactly intent_quotas(count) rows per intent, with no rejected draws
+
+    Each quota is apportioned over keyword options, then timeframe keywords, then templates
+    in proportion to the probabilities the rejection sampler gives them, so every label keeps
+    its expected share. A (keyword, timeframe, template) cell drawn more than once is
+    written once with its draws in the 'count' column, and the sum of 'count' over the
+    output is exactly count. Rows are not guaranteed unique: the odd pair of cells renders
+    the same text (e.g. 'check {keyword}' with 'weather' and '{keyword}' with 'check
+    weather'), giving two rows whose counts add up as sample weight.
+    """
+    tf_options = timeframe_options(timeframe_data)
+    tf_keywords, tf_weights = list(tf_options), list(tf_options.values())
+    template_weights = [1.0] * len(TEMPLATES)
+    
+    for intent_obj, quota in zip(intent_data['intents'], intent_quotas(intent_data, count)):
+        if quota == 0:
+            continue
+        options = keyword_options(intent_obj)
+        for (keyword, sub_intent), option_quota in zip(options, apportion(quota, list(options.values()), rng)):
+            if option_quota == 0:
+                continue
+            for tf_keyword, tf_quota in zip(tf_keywords, apportion(option_quota, tf_weights, rng)):
+                if tf_quota == 0:
+                    continue
+                for template, occurrences in zip(TEMPLATES, apportion(tf_quota, template_weights, rng)):
+                    if occurrences == 0:
+                        continue
+                    query = template.format(keyword=keyword, timeframe=tf_keyword)
+                    yield make_row(query, intent_obj['intent'], sub_intent, labeler, occurrences)
+
+GENERATION_MODES = {
+    'stratified': iter_stratified_queries,
+    'random': iter_random_queries,
+}
+
+def iter_synthetic_queries(intent_data: dict, timeframe_data: dict, count: int = 8000,
+                           rng: random.Random = None, include_examples: bool = True,
+                           reference=None, mode: str = 'stratified') -> Iterator[Dict]:
+    """
+    Lazily generate synthetic training rows, one dict at a time
+
+    rng: random source to draw from (defaults to the global `random` module)
+    include_examples: append the JSON examples and edge cases after the random samples
+    reference: time all timeframe labels are relative to (defaults to now, frozen for the run)
+    mode: 'stratified' (exact per-intent quotas, see iter_stratified_queries) or
+    'random' (original rejection sampler, yields fewer than count rows)
+    """
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown generation mode: {mode} (expected one of {list(GENERATION_MODES)})")
+    rng = rng or random
+    labeler = TimeframeLabeler(timeframe_data, reference)
+    
+    yield from GENERATION_MODES[mode](intent_data, timeframe_data, count, rng, labeler)
+    
+    if include_examples:
+        yield from generate_example_queries(intent_data, timeframe_data, labeler.reference)
+
+def generate_synthetic_queries(intent_data: dict, timeframe_data: dict, count: int = 8000,
+                               rng: random.Random = None, include_examples: bool = True,
+                               reference=None, mode: str = 'stratified') -> List[Dict]:
+    """Generate comprehensive synthetic training data (see iter_synthetic_queries)"""
+    return list(iter_synthetic_queries(
+        intent_data, timeframe_data, count=count, rng=rng,
+        include_examples=include_examples, reference=reference, mode=mode
+    ))
+
+def generate_example_queries(intent_data: dict, timeframe_data: dict, reference=None) -> List[Dict]:
+    """Build the fixed examples from intent_keywords.json plus hand-written edge cases"""
+    training_data = []
+    labeler = TimeframeLabeler(timeframe_data, reference)
     
     # Add examples from JSON with proper timeframe handling
     for intent_obj in intent_data['intents']:
+        sub_intent_matcher = build_sub_intent_matcher(intent_obj)
         for example in intent_obj.get('examples', []):
-            timeframe_type, day_offset, hour_of_day, day_duration, hour_duration = generate_timeframe_labels(example, timeframe_data)
-            forecast_type = generate_forecast_type(day_duration, hour_duration)
-            
             # Try to detect sub_intent from example
-            sub_intent = 'none'
-            if 'sub_intents' in intent_obj and intent_obj['sub_intents']:
-                for sub_intent_obj in intent_obj['sub_intents']:
-                    for kw in sub_intent_obj['keywords']:
-                        if kw.lower() in example.lower():
-                            sub_intent = sub_intent_obj['name']
-                            break
-                    if sub_intent != 'none':
-                        break
+            match = sub_intent_matcher.first_match(example)
+            sub_intent = match[1] if match else 'none'
             
-            training_data.append({
-                'query': example,
-                'intent': intent_obj['intent'],
-                'sub_intent': sub_intent,
-                'timeframe_type': timeframe_type,
-                'day_offset': day_offset,
-                'hour_of_day': hour_of_day,
-                'day_duration': day_duration,
-                'hour_duration': hour_duration,
-                'forecast_type': forecast_type
-            })
+            training_data.append(make_row(example, intent_obj['intent'], sub_intent, labeler))
     
     # Add edge cases and complex queries
     edge_cases = [
@@ -330,7 +582,7 @@ def generate_synthetic_queries(intent_data: dict, timeframe_data: dict, count: i
         ("humidity levels tonight", "humidity", "none", "relative_time", 0, 20, 0, 6, "hourly"),
         ("will there be storms this week", "alerts", "storm", "relative_day", 0, 12, 7, 168, "daily"),
         ("temperature from monday to friday", "temperature", "none", "relative_day", 0, 12, 5, 120, "daily"),
-        ("wind speed in the next 3 hours", "wind", "speed", "relative_time", 0, pendulum.now().hour, 0, 3, "hourly"),
+        ("wind speed in the next 3 hours", "wind", "speed", "relative_time", 0, labeler.reference.hour, 0, 3, "hourly"),
     ]
     
     for query, intent, sub_intent, tf_type, day_off, hour, day_dur, hour_dur, forecast in edge_cases:
@@ -343,51 +595,274 @@ def generate_synthetic_queries(intent_data: dict, timeframe_data: dict, count: i
             'hour_of_day': hour,
             'day_duration': day_dur,
             'hour_duration': hour_dur,
-            'forecast_type': forecast
+            'forecast_type': forecast,
+            'count': 1
         })
     
     return training_data
 
-def save_training_data(data: List[Dict], filename: str = BASE_DIR/'training_data.csv'):
-    """Save training data to CSV"""
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'query', 'intent', 'sub_intent', 'timeframe_type', 
-            'day_offset', 'hour_of_day', 'day_duration', 'hour_duration', 'forecast_type'
-        ])
-        writer.writeheader()
-        writer.writerows(data)
-    print(f"Saved {len(data)} training examples to {filename}")
+def dedupe_rows(rows: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Collapse identical rows into one row whose 'count' is the total number of occurrences
 
-if __name__ == "__main__":
-    intent_data, timeframe_data = load_keywords()
-    training_data = generate_synthetic_queries(intent_data, timeframe_data, count=8000)
-    save_training_data(training_data)
+    Rows are keyed on every column except 'count' in a hash index, so memory grows with
+    the number of unique rows (bounded by the template x keyword x timeframe space), not
+    with the number generated. Unique rows are emitted in first-seen order once the
+    input is exhausted, so nothing is written before then. Stratified output skips it
+    (its cells already carry their counts); random-mode output, example rows and
+    cross-shard merges go through it.
+    """
+    index = {}
+    for row in rows:
+        key = tuple(str(row[field]) for field in FIELDNAMES[:-1])
+        count = int(row.get('count', 1))
+        if key in index:
+            index[key]['count'] += count
+        else:
+            index[key] = {**row, 'count': count}
+    yield from index.values()
+
+def expand_rows(rows: Iterable[Dict]) -> Iterator[Dict]:
+    """Inverse of dedupe_rows: one row with 'count' 1 per occurrence"""
+    for row in rows:
+        for _ in range(int(row.get('count', 1))):
+            yield {**row, 'count': 1}
+
+class TrainingDataStats:
+    """Running counters over a stream of training rows, so summaries need no row list"""
+    
+    def __init__(self, sample_size: int = 5):
+        self.total = 0
+        self.occurrences = 0
+        self.intents = Counter()
+        self.timeframes = Counter()
+        self.sample_size = sample_size
+        self.samples = []
+        # Separate random source so sampling never perturbs generation
+        self._rng = random.Random()
+    
+    def add(self, row: Dict):
+        """Count one row (weighted by its 'count') and keep a reservoir sample of rows"""
+        weight = int(row.get('count', 1))
+        self.total += 1
+        self.occurrences += weight
+        self.intents[row['intent']] += weight
+        self.timeframes[row['timeframe_type']] += weight
+        
+        if len(self.samples) < self.sample_size:
+            self.samples.append(row)
+        else:
+            slot = self._rng.randrange(self.total)
+            if slot < self.sample_size:
+                self.samples[slot] = row
+    
+    def print_summary(self):
+        """Print label distributions and a few random samples"""
+        print("\n=== Training Data Statistics ===")
+        print(f"Total samples: {self.total}")
+        if self.occurrences != self.total:
+            print(f"Occurrences (sum of counts): {self.occurrences}")
+        
+        print(f"\nIntent distribution:")
+        for intent, count in self.intents.most_common():
+            print(f"  {intent}: {count}")
+        
+        print(f"\nTimeframe distribution:")
+        for tf, count in self.timeframes.most_common():
+            print(f"  {tf}: {count}")
+        
+        # Print sample
+        print("\n=== Sample training data ===")
+        for item in self.samples:
+            print(f"\nQuery: {item['query']}")
+            print(f"  Intent: {item['intent']} | Sub: {item['sub_intent']}")
+            print(f"  Timeframe: {item['timeframe_type']}")
+            print(f"  Day offset: {item['day_offset']} | Hour: {item['hour_of_day']}")
+            print(f"  Duration: {item['day_duration']}d {item['hour_duration']}h")
+            print(f"  Forecast: {item['forecast_type']}")
+
+class CsvRowWriter:
+    """CSV export with the same chunked write interface as columnar.CorpusWriter"""
+    
+    def __init__(self, filename):
+        self._file = open(filename, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDNAMES)
+        self._writer.writeheader()
+    
+    def write(self, rows: List[Dict]):
+        self._writer.writerows(rows)
     
-    # Print statistics
-    print("\n=== Training Data Statistics ===")
-    print(f"Total samples: {len(training_data)}")
+    def close(self):
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+OUTPUT_FORMATS = {
+    'columns': lambda path: CorpusWriter(path, CORPUS_SCHEMA),
+    'csv': CsvRowWriter,
+}
+
+DEFAULT_OUTPUTS = {
+    'columns': BASE_DIR/'training_data',
+    'csv': BASE_DIR/'training_data.csv',
+}
+
+def save_training_data(data: Iterable[Dict], filename: str = BASE_DIR/'training_data.csv',
+                       chunk_size: int = 10000, output_format: str = 'csv') -> TrainingDataStats:
+    """
+    Stream training rows to disk in chunks of chunk_size rows
+
+    data may be a list or a generator; at most one chunk is held in memory at a time.
+    output_format: 'csv' or 'columns' (typed .npy-per-column corpus directory, which
+    preprocess_data.py memory-maps instead of parsing text)
+    Returns running statistics collected while writing.
+    """
+    stats = TrainingDataStats()
+    rows = iter(data)
+    with OUTPUT_FORMATS[output_format](filename) as writer:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            writer.write(chunk)
+            for row in chunk:
+                stats.add(row)
+    print(f"Saved {stats.total} training examples to {filename}")
+    return stats
+
+def shard_seed(seed: int, shard_index: int) -> int:
+    """Derive the seed of one shard from the run seed (independent of worker count)"""
+    digest = hashlib.sha256(f"{seed}:{shard_index}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+def shard_sizes(count: int, num_shards: int) -> List[int]:
+    """Split count into num_shards near-equal parts"""
+    base, remainder = divmod(count, num_shards)
+    return [base + (1 if i < remainder else 0) for i in range(num_shards)]
+
+def shard_path(filename, shard_index: int) -> Path:
+    """Output path of one (always CSV) shard, e.g. training_data.shard-00003.csv"""
+    filename = Path(filename)
+    return filename.with_name(f"{filename.stem}.shard-{shard_index:05d}.csv")
+
+def generate_shard(job: Tuple) -> Path:
+    """Generate one shard with its own deterministic seed and stream it to its own file"""
+    shard_index, count, seed, filename, intent_data, timeframe_data, reference, dedupe, mode = job
+    rng = random.Random(shard_seed(seed, shard_index))
+    rows = iter_synthetic_queries(
+        intent_data, timeframe_data, count=count, rng=rng, include_examples=False,
+        reference=reference, mode=mode
+    )
+    if not dedupe:
+        rows = expand_rows(rows)
+    elif mode != 'stratified':  # stratified cells already carry their counts
+        rows = dedupe_rows(rows)
+    path = shard_path(filename, shard_index)
+    save_training_data(rows, path)
+    return path
+
+def iter_csv_rows(paths: List[Path]) -> Iterator[Dict]:
+    """Stream rows from several CSV files in order"""
+    for path in paths:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+def merge_shards(shard_paths: List[Path], filename, extra_rows: List[Dict] = (),
+                 keep_shards: bool = False, dedupe: bool = True,
+                 output_format: str = 'csv') -> TrainingDataStats:
+    """Concatenate shard files in shard order, append extra_rows, and optionally dedupe across shards"""
+    rows = chain(iter_csv_rows(shard_paths), extra_rows)
+    if dedupe:
+        rows = dedupe_rows(rows)
+    stats = save_training_data(rows, filename, output_format=output_format)
+    if not keep_shards:
+        for path in shard_paths:
+            os.remove(path)
+    print(f"Merged {len(shard_paths)} shards into {filename}")
+    return stats
+
+def generate_sharded(intent_data: dict, timeframe_data: dict, count: int, num_shards: int,
+                     workers: int = None, seed: int = 0, filename: str = BASE_DIR/'training_data.csv',
+                     keep_shards: bool = False, reference=None, dedupe: bool = True,
+                     mode: str = 'stratified', output_format: str = 'csv') -> TrainingDataStats:
+    """
+    Generate count samples across num_shards shards on a process pool and merge them
+
+    The shard layout and seeds depend only on (count, num_shards, seed), and every shard
+    labels against the same reference time, so the merged file is identical for any
+    number of workers.
+    """
+    reference = reference or pendulum.now()
+    jobs = [
+        (i, size, seed, filename, intent_data, timeframe_data, reference, dedupe, mode)
+        for i, size in enumerate(shard_sizes(count, num_shards))
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shard_paths = list(pool.map(generate_shard, jobs))
     
-    intents = {}
-    timeframes = {}
-    for item in training_data:
-        intents[item['intent']] = intents.get(item['intent'], 0) + 1
-        timeframes[item['timeframe_type']] = timeframes.get(item['timeframe_type'], 0) + 1
+    examples = generate_example_queries(intent_data, timeframe_data, reference)
+    return merge_shards(
+        shard_paths, filename, extra_rows=examples, keep_shards=keep_shards,
+        dedupe=dedupe, output_format=output_format
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic weather intent training data')
+    parser.add_argument('--count', type=int, default=8000, help='Number of random samples to generate')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='columns',
+                        help='columns: typed .npy-per-column corpus directory; csv: plain CSV export')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Output path (default: training_data/ or training_data.csv)')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='Split generation into this many seeded shards (0 = single process)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Process pool size for sharded mode (default: all cores)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed (sharded mode defaults to 0)')
+    parser.add_argument('--keep-shards', action='store_true', help='Keep per-shard files after merging')
+    parser.add_argument('--mode', choices=list(GENERATION_MODES), default='stratified',
+                        help='stratified: exact per-intent quotas, label mix of the random sampler; '
+                             'random: original rejection sampler')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Write one row per generated query (count 1) instead of merged rows '
+                             'with occurrence counts (merging random-mode output or shards holds '
+                             'every unique row in memory; stratified cells stream with their counts)')
+    parser.add_argument('--reference', type=str, default=None,
+                        help='ISO-8601 reference time for timeframe labels (default: now)')
+    args = parser.parse_args()
     
-    print(f"\nIntent distribution:")
-    for intent, count in sorted(intents.items(), key=lambda x: x[1], reverse=True):
-        print(f"  {intent}: {count}")
+    intent_data, timeframe_data = load_keywords()
+    reference = pendulum.parse(args.reference) if args.reference else pendulum.now()
+    output = args.output or DEFAULT_OUTPUTS[args.format]
     
-    print(f"\nTimeframe distribution:")
-    for tf, count in sorted(timeframes.items(), key=lambda x: x[1], reverse=True):
-        print(f"  {tf}: {count}")
+    if args.shards > 0:
+        seed = args.seed if args.seed is not None else 0
+        stats = generate_sharded(
+            intent_data, timeframe_data, args.count, args.shards,
+            workers=args.workers, seed=seed, filename=output, keep_shards=args.keep_shards,
+            reference=reference, dedupe=not args.no_dedupe, mode=args.mode, output_format=args.format
+        )
+    else:
+        if args.seed is not None:
+            random.seed(args.seed)
+        if args.no_dedupe or args.mode != 'stratified':
+            rows = iter_synthetic_queries(
+                intent_data, timeframe_data, count=args.count, reference=reference, mode=args.mode
+            )
+            rows = expand_rows(rows) if args.no_dedupe else dedupe_rows(rows)
+        else:
+            # Stratified cells already carry their counts, so stream them and dedupe only the
+            # examples (the rare cells rendering the same text stay separate rows)
+            rows = chain(
+                iter_synthetic_queries(
+                    intent_data, timeframe_data, count=args.count, include_examples=False,
+                    reference=reference, mode=args.mode
+                ),
+                dedupe_rows(generate_example_queries(intent_data, timeframe_data, reference))
+            )
+        stats = save_training_data(rows, output, output_format=args.format)
     
-    # Print sample
-    print("\n=== Sample training data ===")
-    for item in random.sample(training_data, min(5, len(training_data))):
-        print(f"\nQuery: {item['query']}")
-        print(f"  Intent: {item['intent']} | Sub: {item['sub_intent']}")
-        print(f"  Timeframe: {item['timeframe_type']}")
-        print(f"  Day offset: {item['day_offset']} | Hour: {item['hour_of_day']}")
-        print(f"  Duration: {item['day_duration']}d {item['hour_duration']}h")
-        print(f"  Forecast: {item['forecast_type']}")
\ No newline at end of file
+    stats.print_summary()
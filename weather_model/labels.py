@@ -0,0 +1,29 @@
+# intent_model/labels.py
+"""
+Label classes for inference, read from model_metadata.json
+
+Each output head's classes are stored as a plain list in the metadata; LabelIndex adds the
+reverse lookup, so loading them needs nothing beyond json (no pickles, no scikit-learn).
+"""
+
+HEADS = ['intent', 'sub_intent', 'timeframe', 'forecast']
+
+class LabelIndex:
+    """Classes of one output head with O(1) lookups in both directions"""
+
+    def __init__(self, classes):
+        self.classes_ = list(classes)
+        self.index = {label: idx for idx, label in enumerate(self.classes_)}
+
+    def __len__(self):
+        return len(self.classes_)
+
+    def transform(self, labels) -> list:
+        return [self.index[label] for label in labels]
+
+    def inverse_transform(self, indices) -> list:
+        return [self.classes_[idx] for idx in indices]
+
+def load_label_indexes(metadata: dict) -> dict:
+    """{head: LabelIndex} from the *_classes lists of model_metadata.json"""
+    return {head: LabelIndex(metadata[f'{head}_classes']) for head in HEADS}
@@ -1,6 +1,81 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from config import MODEL_BACKBONE, EMBEDDING_STORAGE
+
+# Encoders that can feed the shared layers and heads
+BACKBONES = ('lstm', 'cnn', 'bag')
+
+# Storage of the embedding table on export/inference: 'float32' or 'int8' (QuantizedEmbedding)
+EMBEDDING_STORAGES = ('float32', 'int8')
+
+# Outputs of the fused regression head, in column order
+REGRESSION_OUTPUTS = ['day_offset', 'hour_of_day', 'day_duration', 'hour_duration', 'confidence']
+
+class GroupedRegressionHead(nn.Module):
+    """
+    Several independent Linear -> ReLU -> Dropout -> Linear(1) -> Sigmoid heads in one pass
+    
+    The hidden layers of all groups are one [in, groups * width] matmul, and the output units
+    one block-diagonal [groups * width, groups] matmul in which each group reads only its own
+    width-sized slice. Returns [batch, groups].
+    """
+    
+    def __init__(self, in_features, groups, width=64, dropout=0.3):
+        super().__init__()
+        self.groups = groups
+        self.width = width
+        self.hidden = nn.Linear(in_features, groups * width)
+        self.dropout = nn.Dropout(dropout)
+        self.out_weight = nn.Parameter(torch.empty(groups, width))
+        self.out_bias = nn.Parameter(torch.empty(groups))
+        self.register_buffer('block_mask', torch.eye(groups).unsqueeze(2), persistent=False)
+        
+        # Same init as one nn.Linear(width, 1) per group
+        bound = 1 / width ** 0.5
+        nn.init.uniform_(self.out_weight, -bound, bound)
+        nn.init.uniform_(self.out_bias, -bound, bound)
+    
+    def forward(self, x):
+        if torch.is_autocast_enabled(x.device.type):
+            # Regression outputs stay in float32 under mixed precision
+            with torch.autocast(x.device.type, enabled=False):
+                return self.forward(x.float())
+        
+        hidden = self.dropout(F.relu(self.hidden(x)))  # [batch, groups * width]
+        # [groups, groups * width], zero outside each group's slice (constant-folded on export)
+        out_weight = (self.block_mask * self.out_weight.unsqueeze(1)).flatten(1)
+        return torch.sigmoid(F.linear(hidden, out_weight, self.out_bias))
+
+class QuantizedEmbedding(nn.Module):
+    """
+    Inference-only embedding table stored as int8 with one float scale per row
+    
+    Rows are quantized symmetrically (scale = max |w| / 127) and dequantized after the
+    lookup, so only the looked-up rows are ever converted back to float. A quarter of the
+    float32 table's size; build it from a trained nn.Embedding with from_float().
+    """
+    
+    def __init__(self, num_embeddings, embedding_dim):
+        super().__init__()
+        self.num_embeddings = num_embeddings
+        self.embedding_dim = embedding_dim
+        self.register_buffer('weight_int8', torch.zeros(num_embeddings, embedding_dim, dtype=torch.int8))
+        self.register_buffer('scale', torch.zeros(num_embeddings))
+    
+    @classmethod
+    def from_float(cls, embedding):
+        weight = embedding.weight.detach()
+        quantized = cls(weight.size(0), weight.size(1)).to(weight.device)
+        scale = weight.abs().amax(dim=1) / 127
+        # All-zero rows (PAD) keep scale 0 and dequantize back to exact zeros
+        quantized.weight_int8.copy_(torch.round(weight / scale.clamp(min=1e-12).unsqueeze(1)).to(torch.int8))
+        quantized.scale.copy_(scale)
+        return quantized
+    
+    def forward(self, x):
+        return self.weight_int8[x].float() * self.scale[x].unsqueeze(-1)
 
 class IntentClassifier(nn.Module):
     """
@@ -15,6 +90,15 @@ class IntentClassifier(nn.Module):
       - day_duration: [batch, 1] (0-7, number of days)
       - hour_duration: [batch, 1] (0-168, total hours)
       - confidence: [batch, 1] (0-1)
+    
+    Backbones (all pooled to [batch, hidden_dim] before shared_fc):
+      - lstm: 2-layer BiLSTM with attention pooling (most accurate)
+      - cnn: two width-3 convolutions with max pooling
+      - bag: mean of the token embeddings (fastest)
+    
+    Padding (token 0) never reaches the outputs: the LSTM runs over packed sequences and
+    all pooling is masked to the real tokens, so a query gives the same result however
+    far it is padded.
     """
     
     def __init__(
@@ -26,29 +110,46 @@ class IntentClassifier(nn.Module):
         num_sub_intent_classes=30,  # Increased for more sub-intents
         num_timeframe_classes=5,
         num_forecast_classes=3,
-        dropout=0.3
+        dropout=0.3,
+        backbone='lstm'
     ):
         super().__init__()
+        if backbone not in BACKBONES:
+            raise ValueError(f"Unknown backbone {backbone!r}, expected one of {BACKBONES}")
+        self.backbone = backbone
         
         # Embedding layer
         self.embedding = nn.Embedding(vocab_size, embed_dim, padding_idx=0)
         
-        # Bidirectional LSTM
-        self.lstm = nn.LSTM(
-            embed_dim,
-            hidden_dim // 2,
-            num_layers=2,
-            bidirectional=True,
-            batch_first=True,
-            dropout=dropout
-        )
-        
-        # Attention mechanism
-        self.attention = nn.Sequential(
-            nn.Linear(hidden_dim, hidden_dim),
-            nn.Tanh(),
-            nn.Linear(hidden_dim, 1)
-        )
+        if backbone == 'lstm':
+            # Bidirectional LSTM
+            self.lstm = nn.LSTM(
+                embed_dim,
+                hidden_dim // 2,
+                num_layers=2,
+                bidirectional=True,
+                batch_first=True,
+                dropout=dropout
+            )
+            
+            # Attention mechanism
+            self.attention = nn.Sequential(
+                nn.Linear(hidden_dim, hidden_dim),
+                nn.Tanh(),
+                nn.Linear(hidden_dim, 1)
+            )
+        elif backbone == 'cnn':
+            # Token trigram convolutions
+            self.convs = nn.ModuleList([
+                nn.Conv1d(embed_dim, hidden_dim, kernel_size=3, padding=1),
+                nn.Conv1d(hidden_dim, hidden_dim, kernel_size=3, padding=1)
+            ])
+        else:
+            # Projection of the mean embedding
+            self.bag_proj = nn.Sequential(
+                nn.Linear(embed_dim, hidden_dim),
+                nn.ReLU()
+            )
         
         # Shared feature extraction
         self.shared_fc = nn.Sequential(
@@ -66,67 +167,32 @@ class IntentClassifier(nn.Module):
         self.timeframe_head = nn.Linear(hidden_dim, num_timeframe_classes)
         self.forecast_head = nn.Linear(hidden_dim, num_forecast_classes)
         
-        # Enhanced temporal regression heads
-        # Day offset: which day from now (0-6)
-        self.day_offset_head = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(64, 1),
-            nn.Sigmoid()  # Output 0-1, scale to 0-6
-        )
-        
-        # Hour of day: specific hour (0-23)
-        self.hour_of_day_head = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(64, 1),
-            nn.Sigmoid()  # Output 0-1, scale to 0-23
-        )
-        
-        # Day duration: number of days (0-7)
-        self.day_duration_head = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(64, 1),
-            nn.Sigmoid()  # Output 0-1, scale to 0-7
-        )
-        
-        # Hour duration: total hours (0-168)
-        self.hour_duration_head = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(64, 1),
-            nn.Sigmoid()  # Output 0-1, scale to 0-168
-        )
-        
-        # Confidence estimation head
-        self.confidence_head = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(64, 1),
-            nn.Sigmoid()
-        )
+        # Temporal regression heads and confidence, fused into one grouped MLP
+        # (one 64-unit hidden layer per output, all sigmoid 0-1):
+        # day_offset 0-6, hour_of_day 0-23, day_duration 0-7, hour_duration 0-168
+        self.regression_head = GroupedRegressionHead(hidden_dim, len(REGRESSION_OUTPUTS), 64, dropout)
         
-    def forward(self, x):
-        # x: [batch, seq_len]
+    def forward(self, x, lengths=None):
+        # x: [batch, seq_len], right-padded with 0
+        # lengths: [batch] real query lengths, counted from x != 0 if not given
+        if lengths is None:
+            lengths = (x != 0).sum(dim=1)
+        lengths = lengths.clamp(min=1)  # an empty query still reads one (pad) step
+        mask = torch.arange(x.size(1), device=x.device).unsqueeze(0) < lengths.unsqueeze(1)  # [batch, seq_len]
         
         # Embedding
         embedded = self.embedding(x)  # [batch, seq_len, embed_dim]
         
-        # LSTM
-        lstm_out, _ = self.lstm(embedded)  # [batch, seq_len, hidden_dim]
-        
-        # Attention pooling
-        attention_weights = F.softmax(self.attention(lstm_out), dim=1)  # [batch, seq_len, 1]
-        attended = torch.sum(attention_weights * lstm_out, dim=1)  # [batch, hidden_dim]
+        # Pooled sequence encoding
+        if self.backbone == 'lstm':
+            pooled = self._encode_lstm(embedded, lengths, mask)
+        elif self.backbone == 'cnn':
+            pooled = self._encode_cnn(embedded, mask)
+        else:
+            pooled = self._encode_bag(embedded, lengths)
         
         # Shared features
-        features = self.shared_fc(attended)  # [batch, hidden_dim]
+        features = self.shared_fc(pooled)  # [batch, hidden_dim]
         
         # Task outputs
         intent_logits = self.intent_head(features)
@@ -134,12 +200,10 @@ class IntentClassifier(nn.Module):
         timeframe_logits = self.timeframe_head(features)
         forecast_logits = self.forecast_head(features)
         
-        # Temporal outputs (normalized 0-1)
-        day_offset = self.day_offset_head(features)
-        hour_of_day = self.hour_of_day_head(features)
-        day_duration = self.day_duration_head(features)
-        hour_duration = self.hour_duration_head(features)
-        confidence = self.confidence_head(features)
+        # Temporal outputs (normalized 0-1) and confidence, [batch, 1] each
+        day_offset, hour_of_day, day_duration, hour_duration, confidence = (
+            self.regression_head(features).split(1, dim=1)
+        )
         
         return {
             'intent_logits': intent_logits,
@@ -152,53 +216,135 @@ class IntentClassifier(nn.Module):
             'hour_duration': hour_duration,
             'confidence': confidence
         }
+    
+    def quantize_embedding(self):
+        """Swap the float embedding table for its int8 QuantizedEmbedding (inference only)"""
+        if isinstance(self.embedding, nn.Embedding):
+            self.embedding = QuantizedEmbedding.from_float(self.embedding)
+        return self
+    
+    def load_state_dict(self, state_dict, *args, **kwargs):
+        """
+        Also accepts checkpoints with the separate *_head regression MLPs of older versions,
+        and checkpoints saved after quantize_embedding()
+        """
+        if 'embedding.weight_int8' in state_dict:
+            self.quantize_embedding()
+        return super().load_state_dict(self._fuse_legacy_heads(state_dict), *args, **kwargs)
+    
+    @staticmethod
+    def _fuse_legacy_heads(state_dict):
+        # Legacy layout: {name}_head.0 = Linear(hidden, 64), {name}_head.3 = Linear(64, 1)
+        legacy = [f'{name}_head' for name in REGRESSION_OUTPUTS]
+        if f'{legacy[0]}.0.weight' not in state_dict:
+            return state_dict
+        
+        state_dict = dict(state_dict)
+        layers = {key: [state_dict.pop(f'{head}.{key}') for head in legacy]
+                  for key in ('0.weight', '0.bias', '3.weight', '3.bias')}
+        state_dict['regression_head.hidden.weight'] = torch.cat(layers['0.weight'], dim=0)
+        state_dict['regression_head.hidden.bias'] = torch.cat(layers['0.bias'], dim=0)
+        state_dict['regression_head.out_weight'] = torch.cat(layers['3.weight'], dim=0)
+        state_dict['regression_head.out_bias'] = torch.cat(layers['3.bias'], dim=0)
+        return state_dict
+    
+    def _encode_lstm(self, embedded, lengths, mask):
+        lstm_out = self._run_lstm(embedded, lengths)  # [batch, seq_len, hidden_dim]
+        
+        # Attention pooling over the real tokens
+        scores = self.attention(lstm_out).masked_fill(~mask.unsqueeze(-1), float('-inf'))
+        attention_weights = F.softmax(scores, dim=1)  # [batch, seq_len, 1]
+        return torch.sum(attention_weights * lstm_out, dim=1)  # [batch, hidden_dim]
+    
+    @torch.compiler.disable
+    def _run_lstm(self, embedded, lengths):
+        # LSTM over the real tokens only; packing is skipped for batches without padding
+        # (common with length-bucketed batches), but always traced for export.
+        # Dynamo traces neither pack_padded_sequence nor the padding check (a host sync),
+        # so under torch.compile this runs eagerly as one fixed break between two graphs
+        if torch.jit.is_tracing() or bool((lengths < embedded.size(1)).any()):
+            packed = pack_padded_sequence(embedded, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            lstm_out, _ = self.lstm(packed)
+            lstm_out, _ = pad_packed_sequence(lstm_out, batch_first=True, total_length=embedded.size(1))
+        else:
+            lstm_out, _ = self.lstm(embedded)
+        return lstm_out
+    
+    def _encode_cnn(self, embedded, mask):
+        # Padded positions are zeroed after every layer, so they look like the
+        # convolution's own zero padding and never leak into real positions
+        keep = mask.unsqueeze(1)  # [batch, 1, seq_len]
+        hidden = embedded.transpose(1, 2)  # [batch, embed_dim, seq_len]
+        for conv in self.convs:
+            hidden = F.relu(conv(hidden)).masked_fill(~keep, 0.0)
+        
+        # Max pooling over the real tokens (ReLU outputs are >= 0, so zeroed pads never win)
+        return hidden.max(dim=2).values  # [batch, hidden_dim]
+    
+    def _encode_bag(self, embedded, lengths):
+        # PAD embeddings are zero (padding_idx), so the sum only covers real tokens
+        mean = embedded.sum(dim=1) / lengths.unsqueeze(1).to(embedded.dtype)
+        return self.bag_proj(mean)  # [batch, hidden_dim]
 
 class IntentLoss(nn.Module):
-    """Multi-task loss with enhanced temporal components"""
+    """
+    Multi-task loss with enhanced temporal components
+
+    If targets contain a 'weight' entry (occurrence counts of deduplicated rows), every
+    component is a weighted mean over the batch, so one row with count k contributes
+    exactly like k identical rows would.
+    """
+    
+    # Weight of each head's loss in the total
+    HEAD_WEIGHTS = {
+        'intent': 2.0,
+        'sub_intent': 1.5,
+        'timeframe': 1.5,
+        'forecast': 1.0,
+        'day_offset': 1.0,
+        'hour_of_day': 1.0,
+        'day_duration': 0.8,
+        'hour_duration': 1.2
+    }
+    CLASSIFICATION_HEADS = ['intent', 'sub_intent', 'timeframe', 'forecast']
     
     def __init__(self):
         super().__init__()
-        self.ce_loss = nn.CrossEntropyLoss()
-        self.mse_loss = nn.MSELoss()
+        self.ce_loss = nn.CrossEntropyLoss(reduction='none')
+        self.mse_loss = nn.MSELoss(reduction='none')
+    
+    def _reduce(self, loss, weight):
+        if weight is None:
+            return loss.mean()
+        return (loss * weight).sum() / weight.sum()
         
     def forward(self, outputs, targets):
-        intent_loss = self.ce_loss(outputs['intent_logits'], targets['intent'])
-        sub_intent_loss = self.ce_loss(outputs['sub_intent_logits'], targets['sub_intent'])
-        timeframe_loss = self.ce_loss(outputs['timeframe_logits'], targets['timeframe'])
-        forecast_loss = self.ce_loss(outputs['forecast_logits'], targets['forecast'])
+        weight = targets.get('weight')
+        
+        intent_loss = self._reduce(self.ce_loss(outputs['intent_logits'], targets['intent']), weight)
+        sub_intent_loss = self._reduce(self.ce_loss(outputs['sub_intent_logits'], targets['sub_intent']), weight)
+        timeframe_loss = self._reduce(self.ce_loss(outputs['timeframe_logits'], targets['timeframe']), weight)
+        forecast_loss = self._reduce(self.ce_loss(outputs['forecast_logits'], targets['forecast']), weight)
         
         # Temporal losses
-        day_offset_loss = self.mse_loss(
-            outputs['day_offset'].squeeze(),
+        day_offset_loss = self._reduce(self.mse_loss(
+            outputs['day_offset'].squeeze(1),
             targets['day_offset']
-        )
-        hour_of_day_loss = self.mse_loss(
-            outputs['hour_of_day'].squeeze(),
+        ), weight)
+        hour_of_day_loss = self._reduce(self.mse_loss(
+            outputs['hour_of_day'].squeeze(1),
             targets['hour_of_day']
-        )
-        day_duration_loss = self.mse_loss(
-            outputs['day_duration'].squeeze(),
+        ), weight)
+        day_duration_loss = self._reduce(self.mse_loss(
+            outputs['day_duration'].squeeze(1),
             targets['day_duration']
-        )
-        hour_duration_loss = self.mse_loss(
-            outputs['hour_duration'].squeeze(),
+        ), weight)
+        hour_duration_loss = self._reduce(self.mse_loss(
+            outputs['hour_duration'].squeeze(1),
             targets['hour_duration']
-        )
-        
-        # Weighted sum
-        total_loss = (
-            2.0 * intent_loss +
-            1.5 * sub_intent_loss +
-            1.5 * timeframe_loss +
-            1.0 * forecast_loss +
-            1.0 * day_offset_loss +
-            1.0 * hour_of_day_loss +
-            0.8 * day_duration_loss +
-            1.2 * hour_duration_loss
-        )
+        ), weight)
         
-        return {
-            'total': total_loss,
+        losses = {
             'intent': intent_loss,
             'sub_intent': sub_intent_loss,
             'timeframe': timeframe_loss,
@@ -208,16 +354,91 @@ class IntentLoss(nn.Module):
             'day_duration': day_duration_loss,
             'hour_duration': hour_duration_loss
         }
+        
+        # Weighted sum
+        total_loss = sum(self.HEAD_WEIGHTS[name] * loss for name, loss in losses.items())
+        
+        return {'total': total_loss, **losses}
 
-def create_model(vocab_size, num_intent, num_sub_intent, num_timeframe, num_forecast):
-    """Factory function to create model"""
+class DistillationLoss(nn.Module):
+    """
+    Multi-task loss for training a student against a teacher's outputs
+    
+    The soft part is IntentLoss with the teacher as targets: cross-entropy against the
+    teacher's temperature-softened class distributions (scaled by T^2 to keep gradient
+    magnitudes independent of T) and MSE against the teacher's temporal outputs. It is
+    mixed with the usual hard-label IntentLoss: total = alpha * hard + (1 - alpha) * soft.
+    """
+    
+    def __init__(self, temperature=2.0, alpha=0.5):
+        super().__init__()
+        self.temperature = temperature
+        self.alpha = alpha
+        self.intent_loss = IntentLoss()
+    
+    def forward(self, outputs, targets, teacher_outputs):
+        T = self.temperature
+        hard = self.intent_loss(outputs, targets)
+        
+        soft_outputs = dict(outputs)
+        soft_targets = {'weight': targets.get('weight')}
+        for head in IntentLoss.CLASSIFICATION_HEADS:
+            soft_outputs[f'{head}_logits'] = outputs[f'{head}_logits'] / T
+            soft_targets[head] = F.softmax(teacher_outputs[f'{head}_logits'] / T, dim=1)
+        for head in ['day_offset', 'hour_of_day', 'day_duration', 'hour_duration']:
+            soft_targets[head] = teacher_outputs[head].squeeze(1)
+        soft = self.intent_loss(soft_outputs, soft_targets)
+        
+        losses = {}
+        for head in IntentLoss.HEAD_WEIGHTS:
+            scale = T * T if head in IntentLoss.CLASSIFICATION_HEADS else 1.0
+            losses[head] = self.alpha * hard[head] + (1 - self.alpha) * scale * soft[head]
+        total_loss = sum(IntentLoss.HEAD_WEIGHTS[head] * loss for head, loss in losses.items())
+        
+        return {'total': total_loss, **losses}
+
+def create_model(vocab_size, num_intent, num_sub_intent, num_timeframe, num_forecast, backbone=None,
+                 embed_dim=128, hidden_dim=256):
+    """Factory function to create model (backbone defaults to config.MODEL_BACKBONE)"""
     return IntentClassifier(
         vocab_size=vocab_size,
-        embed_dim=128,
-        hidden_dim=256,
+        embed_dim=embed_dim,
+        hidden_dim=hidden_dim,
         num_intent_classes=num_intent,
         num_sub_intent_classes=num_sub_intent,
         num_timeframe_classes=num_timeframe,
         num_forecast_classes=num_forecast,
-        dropout=0.3
-    )
\ No newline at end of file
+        dropout=0.3,
+        backbone=backbone or MODEL_BACKBONE
+    )
+
+def checkpoint_dims(state_dict) -> dict:
+    """create_model size arguments of saved weights (distilled and pruned models are smaller)"""
+    return {
+        'embed_dim': state_dict['embedding.weight'].shape[1],
+        'hidden_dim': state_dict['shared_fc.0.weight'].shape[0],
+    }
+
+def load_model(path, metadata, backbone=None):
+    """Rebuild a saved model at the size its weights were trained with"""
+    state_dict = torch.load(path, map_location='cpu')
+    model = create_model(
+        vocab_size=metadata['vocab_size'],
+        num_intent=len(metadata['intent_classes']),
+        num_sub_intent=len(metadata['sub_intent_classes']),
+        num_timeframe=len(metadata['timeframe_classes']),
+        num_forecast=len(metadata['forecast_classes']),
+        backbone=backbone,
+        **checkpoint_dims(state_dict)
+    )
+    model.load_state_dict(state_dict)
+    return model
+
+def apply_embedding_storage(model, storage=None):
+    """Store a trained model's embedding table as storage (defaults to config.EMBEDDING_STORAGE)"""
+    storage = storage or EMBEDDING_STORAGE
+    if storage not in EMBEDDING_STORAGES:
+        raise ValueError(f"Unknown embedding storage {storage!r}, expected one of {EMBEDDING_STORAGES}")
+    if storage == 'int8':
+        model.quantize_embedding()
+    return model
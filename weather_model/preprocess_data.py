@@ -3,159 +3,381 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import json
-import pickle
+import math
+from collections import Counter
 from config import BASE_DIR
+from tokens import UNK_ID, hash_token, hash_spec
+from columnar import (
+    is_columnar, load_corpus, iter_corpus, save_arrays, DatasetWriter,
+    narrowest_int, take_ragged,
+)
+
+# Dataset array name -> training data column
+LABEL_COLUMNS = {
+    'y_intent': 'intent',
+    'y_sub_intent': 'sub_intent',
+    'y_timeframe': 'timeframe_type',
+    'y_forecast': 'forecast_type',
+}
+TEMPORAL_COLUMNS = {
+    'y_day_offset': 'day_offset',
+    'y_hour_of_day': 'hour_of_day',
+    'y_day_duration': 'day_duration',
+    'y_hour_duration': 'hour_duration',
+}
+
+def corpus_frame(columns: dict):
+    """DataFrame over load_corpus/iter_corpus columns without copying them"""
+    frame = {}
+    for name, column in columns.items():
+        if isinstance(column, tuple):
+            codes, categories = column
+            frame[name] = pd.Categorical.from_codes(codes, categories)
+        elif isinstance(column, list):
+            frame[name] = pd.Series(column, dtype=object)
+        else:
+            frame[name] = column
+    return pd.DataFrame(frame, copy=False)
+
+def load_training_frame(path):
+    """
+    Load training data from a columnar corpus directory or a CSV file
+
+    Corpus columns are memory-mapped; categorical columns stay dictionary-encoded
+    (pandas Categorical over the stored codes) instead of being parsed from text.
+    """
+    if not is_columnar(path):
+        return pd.read_csv(path)
+    return corpus_frame(load_corpus(path))
+
+def iter_training_frames(path, chunk_size):
+    """Chunked load_training_frame: DataFrames of at most chunk_size rows"""
+    if not is_columnar(path):
+        yield from pd.read_csv(path, chunksize=chunk_size)
+        return
+    for columns in iter_corpus(path, chunk_size):
+        yield corpus_frame(columns)
+
+def fit_labels(encoder, column):
+    """Fit a LabelEncoder on a column and encode it (categoricals are remapped per code)"""
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        return encoder.fit_transform(column.values)
+    
+    categories = np.asarray(column.cat.categories)
+    codes = column.cat.codes.to_numpy()
+    present = np.unique(codes)
+    encoder.fit(categories[present])
+    lookup = np.zeros(len(categories), dtype=np.int64)
+    lookup[present] = encoder.transform(categories[present])
+    return lookup[codes]
+
+def encode_labels(encoder, column):
+    """Encode a column with an already fitted LabelEncoder"""
+    return pd.Categorical(column, categories=encoder.classes_).codes.astype(np.int64)
+
+def test_quotas(class_counts, test_size):
+    """
+    Per-class test rows for a stratified split: the train_test_split total
+    (ceil(test_size * n)) shared out by largest remainder
+    """
+    class_counts = np.asarray(class_counts)
+    total = math.ceil(test_size * class_counts.sum())
+    exact = class_counts * total / max(class_counts.sum(), 1)
+    quotas = np.floor(exact).astype(np.int64)
+    order = np.argsort(-(exact - quotas), kind='stable')
+    quotas[order[:total - quotas.sum()]] += 1
+    return quotas
 
 class IntentDataPreprocessor:
-    def __init__(self):
+    def __init__(self, max_length=None, length_percentile=99.9, hash_buckets=None):
         self.intent_encoder = LabelEncoder()
         self.sub_intent_encoder = LabelEncoder()
         self.timeframe_encoder = LabelEncoder()
         self.forecast_encoder = LabelEncoder()
         self.vocab = {}
         self.vocab_size = 0
-        self.max_length = 50
+        # None: chosen from the data as the length_percentile-th percentile of query lengths
+        self.max_length = max_length
+        self.length_percentile = length_percentile
+        # None: one embedding row per word seen in the data; else a fixed hashed table
+        self.hash_buckets = hash_buckets
+        
+    def tokenize(self, queries):
+        """
+        Lowercase, whitespace-split and factorize all queries in one pass
+        Returns (rows, codes, words): query index and word code of every token, and the
+        distinct words in first-occurrence order
+        """
+        # Join with a separator token so a single lower().split() tokenizes everything;
+        # running separator counts then give each token's query index
+        separator = '\x01'
+        text = f' {separator} '.join(q.replace(separator, ' ') for q in queries).lower()
+        codes, words = pd.factorize(np.array(text.split(), dtype=object))
         
-    def build_vocabulary(self, queries):
-        """Build vocabulary from queries"""
-        word_freq = {}
-        for query in queries:
-            for word in query.lower().split():
-                word_freq[word] = word_freq.get(word, 0) + 1
+        is_separator = codes == np.flatnonzero(words == separator).min(initial=len(words))
+        rows = np.cumsum(is_separator)[~is_separator]
+        return rows, codes[~is_separator], words
+    
+    def build_vocabulary(self, queries, tokens=None):
+        """Build vocabulary from queries (tokens: optional precomputed tokenize(queries))"""
+        _, codes, words = tokens if tokens is not None else self.tokenize(queries)
+        self.set_vocabulary(words, np.bincount(codes, minlength=len(words)))
+    
+    def set_vocabulary(self, words, counts):
+        """Build the vocabulary from distinct words (first-occurrence order) and their counts"""
+        words = np.asarray(words, dtype=object)
+        counts = np.asarray(counts)
+        
+        if self.hash_buckets:
+            # Fixed-size table: only the reserved ids are stored, words are hashed on lookup
+            self.vocab = {'<PAD>': 0, '<UNK>': 1}
+            self.vocab_size = len(self.vocab) + self.hash_buckets
+            buckets = np.array([self.token_id(word) for word in words], dtype=np.int64)
+            words_per_bucket = np.bincount(buckets, minlength=self.vocab_size)
+            shared = counts[words_per_bucket[buckets] > 1].sum() / max(counts.sum(), 1)
+            print(f"Hashed {len(words)} words into {self.hash_buckets} buckets "
+                  f"({np.count_nonzero(words_per_bucket)} used, {shared:.2%} of tokens in shared buckets)")
+            print(f"Vocabulary size: {self.vocab_size}")
+            return
         
-        # Sort by frequency and assign indices
-        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+        # Sort by frequency; the stable sort keeps first-occurrence order among ties
+        order = np.argsort(-counts, kind='stable')
+        sorted_words = words[order[counts[order] > 0]]
         
         # Reserve indices: 0=PAD, 1=UNK
         self.vocab = {'<PAD>': 0, '<UNK>': 1}
-        for idx, (word, _) in enumerate(sorted_words, start=2):
+        for idx, word in enumerate(sorted_words, start=2):
             self.vocab[word] = idx
         
         self.vocab_size = len(self.vocab)
         print(f"Vocabulary size: {self.vocab_size}")
         
-    def encode_query(self, query):
-        """Convert query to sequence of token indices"""
-        tokens = query.lower().split()
-        indices = [self.vocab.get(word, 1) for word in tokens]  # 1 = UNK
+    def token_id(self, word):
+        """Index of a word: its hash bucket in hashed mode, else its vocabulary index (1 = UNK)"""
+        if self.hash_buckets:
+            return hash_token(word, self.hash_buckets)
+        return self.vocab.get(word, UNK_ID)
+    
+    def choose_max_length(self, length_counts):
+        """
+        Report the token-length distribution (length_counts[n]: weight of n-token queries)
+        and set max_length from it unless one was given
+        """
+        length_counts = np.asarray(length_counts, dtype=np.float64)
+        cumulative = np.cumsum(length_counts) / max(length_counts.sum(), 1)
+        percentile = lambda p: min(int(np.searchsorted(cumulative, p / 100)), len(cumulative) - 1)
         
-        # Pad or truncate
-        if len(indices) < self.max_length:
-            indices += [0] * (self.max_length - len(indices))
-        else:
-            indices = indices[:self.max_length]
+        mean = (np.arange(len(length_counts)) * length_counts).sum() / max(length_counts.sum(), 1)
+        summary = ', '.join(f'p{p:g} {percentile(p)}' for p in (50, 90, 99, 99.9))
+        print(f"\nTokens per query: mean {mean:.1f}, {summary}, max {len(length_counts) - 1}")
         
-        return indices
+        if self.max_length is None:
+            self.max_length = max(percentile(self.length_percentile), 1)
+        truncated = 1 - cumulative[min(self.max_length, len(cumulative) - 1)]
+        print(f"max_length: {self.max_length} ({truncated:.3%} of queries truncated)")
     
-    def normalize_value(self, value, max_val):
-        """Normalize value to 0-1 range"""
-        return min(value / max_val, 1.0)
+    def encode_ragged(self, queries, tokens=None):
+        """
+        Token ids of lowercased, whitespace-split queries as (token_ids, offsets), query i being
+        token_ids[offsets[i]:offsets[i + 1]]; truncated to max_length but not padded, token_ids
+        use the narrowest dtype for the vocabulary
+        """
+        rows, codes, words = tokens if tokens is not None else self.tokenize(queries)
+        
+        # Look up each distinct word once, then map every token through its code
+        word_ids = np.array([self.token_id(word) for word in words], dtype=np.int64)
+        token_ids = word_ids[codes]
+        
+        # Position of every token within its query
+        lengths = np.bincount(rows, minlength=len(queries))
+        starts = np.cumsum(lengths) - lengths
+        positions = np.arange(len(rows)) - starts[rows]
+        
+        keep = positions < self.max_length
+        offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+        np.cumsum(np.minimum(lengths, self.max_length), out=offsets[1:])
+        return token_ids[keep].astype(narrowest_int([0, self.vocab_size - 1])), offsets
     
-    def preprocess(self, csv_path, test_size=0.2):
-        """Load and preprocess training data"""
-        df = pd.read_csv(csv_path)
+    def preprocess(self, data_path, test_size=0.2):
+        """Load and preprocess training data (corpus directory or CSV)"""
+        df = load_training_frame(data_path)
         
         print(f"Loaded {len(df)} samples")
         print(f"\nIntent distribution:\n{df['intent'].value_counts()}")
         print(f"\nTimeframe distribution:\n{df['timeframe_type'].value_counts()}")
         
         # Build vocabulary
-        self.build_vocabulary(df['query'].values)
-        
-        # Encode queries
-        X = np.array([self.encode_query(q) for q in df['query'].values])
+        queries = df['query'].to_numpy(dtype=object)
+        tokens = self.tokenize(queries)
+        self.build_vocabulary(queries, tokens)
         
-        # Encode categorical labels
-        y_intent = self.intent_encoder.fit_transform(df['intent'].values)
-        y_sub_intent = self.sub_intent_encoder.fit_transform(df['sub_intent'].values)
-        y_timeframe = self.timeframe_encoder.fit_transform(df['timeframe_type'].values)
-        y_forecast = self.forecast_encoder.fit_transform(df['forecast_type'].values)
+        # Occurrence counts of deduplicated rows become sample weights
+        if 'count' in df.columns:
+            sample_weight = df['count'].values
+        else:
+            sample_weight = np.ones(len(df), dtype=np.uint8)
         
-        # Normalize temporal values
-        # day_offset: 0-6 days
-        y_day_offset = np.array([self.normalize_value(d, 6) for d in df['day_offset'].values])
+        # Pick max_length from the (occurrence-weighted) length distribution
+        lengths = np.bincount(tokens[0], minlength=len(queries))
+        self.choose_max_length(np.bincount(lengths, weights=sample_weight))
         
-        # hour_of_day: 0-23 hours
-        y_hour_of_day = np.array([self.normalize_value(h, 23) for h in df['hour_of_day'].values])
+        # Encode queries as ragged token ids; padding happens per batch at training time
+        token_ids, offsets = self.encode_ragged(queries, tokens)
         
-        # day_duration: 0-7 days
-        y_day_duration = np.array([self.normalize_value(d, 7) for d in df['day_duration'].values])
+        # Encode categorical labels
+        y_intent = fit_labels(self.intent_encoder, df['intent'])
+        y_sub_intent = fit_labels(self.sub_intent_encoder, df['sub_intent'])
+        y_timeframe = fit_labels(self.timeframe_encoder, df['timeframe_type'])
+        y_forecast = fit_labels(self.forecast_encoder, df['forecast_type'])
         
-        # hour_duration: 0-168 hours (1 week)
-        y_hour_duration = np.array([self.normalize_value(h, 168) for h in df['hour_duration'].values])
+        # Temporal values are stored as raw integers and normalized when batches are
+        # read (see temporal_normalization in model_metadata.json):
+        # day_offset 0-6 days, hour_of_day 0-23, day_duration 0-7 days, hour_duration 0-168 hours
         
-        # Split data
-        X_train, X_test, y_intent_train, y_intent_test = train_test_split(
-            X, y_intent, test_size=test_size, random_state=42, stratify=y_intent
+        # One stratified split of the row indices, applied to every column, so
+        # adding an output head costs one extra fancy-index at split time
+        train_idx, test_idx = train_test_split(
+            np.arange(len(df)), test_size=test_size, random_state=42, stratify=y_intent
         )
         
-        _, _, y_sub_intent_train, y_sub_intent_test = train_test_split(
-            X, y_sub_intent, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        columns = {
+            'y_intent': y_intent,
+            'y_sub_intent': y_sub_intent,
+            'y_timeframe': y_timeframe,
+            'y_forecast': y_forecast,
+            'y_day_offset': df['day_offset'].values,
+            'y_hour_of_day': df['hour_of_day'].values,
+            'y_day_duration': df['day_duration'].values,
+            'y_hour_duration': df['hour_duration'].values,
+            'sample_weight': sample_weight,
+        }
         
-        _, _, y_timeframe_train, y_timeframe_test = train_test_split(
-            X, y_timeframe, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        # Every column gets the smallest integer dtype that holds its values
+        data = {}
+        for split, idx in (('train', train_idx), ('test', test_idx)):
+            data[f'tokens_{split}'], data[f'offsets_{split}'] = take_ragged(token_ids, offsets, idx)
+            for name, values in columns.items():
+                values = np.asarray(values)
+                data[f'{name}_{split}'] = values[idx].astype(narrowest_int(values))
         
-        _, _, y_forecast_train, y_forecast_test = train_test_split(
-            X, y_forecast, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        print(f"\nTrain samples: {len(train_idx)}")
+        print(f"Test samples: {len(test_idx)}")
+        print(f"Effective samples (sum of weights): {sample_weight.sum():.0f}")
         
-        _, _, y_day_offset_train, y_day_offset_test = train_test_split(
-            X, y_day_offset, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        return data
+    
+    def label_encoders(self):
+        """Dataset array name -> LabelEncoder"""
+        return {
+            'y_intent': self.intent_encoder,
+            'y_sub_intent': self.sub_intent_encoder,
+            'y_timeframe': self.timeframe_encoder,
+            'y_forecast': self.forecast_encoder,
+        }
+    
+    def preprocess_streaming(self, data_path, output_dir, chunk_size=100000, test_size=0.2, seed=42):
+        """
+        Out-of-core preprocess: two passes over chunk_size rows at a time, so peak memory
+        is bounded by the chunk size rather than the corpus
         
-        _, _, y_hour_of_day_train, y_hour_of_day_test = train_test_split(
-            X, y_hour_of_day, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        Pass 1 collects word counts, label classes and value ranges; pass 2 encodes each chunk
+        and appends it to the train/test arrays of a preprocessed dataset in output_dir.
+        The split is stratified by intent with the same per-class sizes as preprocess(), but
+        the rows drawn differ from train_test_split's.
+        """
+        # Pass 1: vocabulary, classes and value ranges
+        word_counts = {}
+        label_values = {name: set() for name in LABEL_COLUMNS}
+        value_range = {name: [0, 1] for name in [*TEMPORAL_COLUMNS, 'sample_weight']}
+        intent_counts = Counter()
+        timeframe_counts = Counter()
+        length_counts = np.zeros(1)
+        num_rows = 0
+        for df in iter_training_frames(data_path, chunk_size):
+            rows, codes, words = self.tokenize(df['query'].to_numpy(dtype=object))
+            for word, count in zip(words, np.bincount(codes, minlength=len(words)).tolist()):
+                word_counts[word] = word_counts.get(word, 0) + count
+            
+            weights = df['count'].values if 'count' in df.columns else None
+            chunk_lengths = np.bincount(np.bincount(rows, minlength=len(df)), weights=weights)
+            length_counts = np.pad(length_counts, (0, max(len(chunk_lengths) - len(length_counts), 0)))
+            length_counts[:len(chunk_lengths)] += chunk_lengths
+            
+            for name, column in LABEL_COLUMNS.items():
+                label_values[name].update(df[column].unique())
+            for name, column in [*TEMPORAL_COLUMNS.items(), ('sample_weight', 'count')]:
+                if column in df.columns and len(df):
+                    value_range[name][0] = min(value_range[name][0], int(df[column].min()))
+                    value_range[name][1] = max(value_range[name][1], int(df[column].max()))
+            
+            intent_counts.update(df['intent'].value_counts().to_dict())
+            timeframe_counts.update(df['timeframe_type'].value_counts().to_dict())
+            num_rows += len(df)
         
-        _, _, y_day_duration_train, y_day_duration_test = train_test_split(
-            X, y_day_duration, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        print(f"Loaded {num_rows} samples")
+        print(f"\nIntent distribution:\n{pd.Series(intent_counts).sort_values(ascending=False)}")
+        print(f"\nTimeframe distribution:\n{pd.Series(timeframe_counts).sort_values(ascending=False)}")
         
-        _, _, y_hour_duration_train, y_hour_duration_test = train_test_split(
-            X, y_hour_duration, test_size=test_size, random_state=42, stratify=y_intent
-        )
+        self.set_vocabulary(list(word_counts), list(word_counts.values()))
+        self.choose_max_length(length_counts)
+        encoders = self.label_encoders()
+        for name, encoder in encoders.items():
+            encoder.fit(np.array(sorted(label_values[name]), dtype=object))
         
-        print(f"\nTrain samples: {len(X_train)}")
-        print(f"Test samples: {len(X_test)}")
+        # Exact per-class test counts, drawn as a sequential uniform sample: each chunk takes
+        # a hypergeometric share of the class's remaining test quota
+        rows_left = np.array([intent_counts[c] for c in self.intent_encoder.classes_], dtype=np.int64)
+        test_left = test_quotas(rows_left, test_size)
+        rng = np.random.default_rng(seed)
         
-        return {
-            'X_train': X_train,
-            'X_test': X_test,
-            'y_intent_train': y_intent_train,
-            'y_intent_test': y_intent_test,
-            'y_sub_intent_train': y_sub_intent_train,
-            'y_sub_intent_test': y_sub_intent_test,
-            'y_timeframe_train': y_timeframe_train,
-            'y_timeframe_test': y_timeframe_test,
-            'y_forecast_train': y_forecast_train,
-            'y_forecast_test': y_forecast_test,
-            'y_day_offset_train': y_day_offset_train,
-            'y_day_offset_test': y_day_offset_test,
-            'y_hour_of_day_train': y_hour_of_day_train,
-            'y_hour_of_day_test': y_hour_of_day_test,
-            'y_day_duration_train': y_day_duration_train,
-            'y_day_duration_test': y_day_duration_test,
-            'y_hour_duration_train': y_hour_duration_train,
-            'y_hour_duration_test': y_hour_duration_test,
-        }
+        dtypes = {'tokens': narrowest_int([0, self.vocab_size - 1]), 'offsets': np.int64}
+        dtypes.update({name: narrowest_int([0, len(encoder.classes_) - 1]) for name, encoder in encoders.items()})
+        dtypes.update({name: narrowest_int(bounds) for name, bounds in value_range.items()})
+        splits = ('train', 'test')
+        writer = DatasetWriter(output_dir, {
+            f'{name}_{split}': dtype for name, dtype in dtypes.items() for split in splits
+        })
+        token_base = dict.fromkeys(splits, 0)
+        for split in splits:
+            writer.append(f'offsets_{split}', [0])
+        
+        # Pass 2: encode and append each chunk
+        with writer:
+            for df in iter_training_frames(data_path, chunk_size):
+                token_ids, offsets = self.encode_ragged(df['query'].to_numpy(dtype=object))
+                columns = {name: encode_labels(encoders[name], df[column]) for name, column in LABEL_COLUMNS.items()}
+                columns.update({name: df[column].values for name, column in TEMPORAL_COLUMNS.items()})
+                columns['sample_weight'] = df['count'].values if 'count' in df.columns else np.ones(len(df))
+                
+                is_test = np.zeros(len(df), dtype=bool)
+                for label in np.unique(columns['y_intent']):
+                    members = np.flatnonzero(columns['y_intent'] == label)
+                    take = rng.hypergeometric(test_left[label], rows_left[label] - test_left[label], len(members))
+                    is_test[rng.choice(members, take, replace=False)] = True
+                    rows_left[label] -= len(members)
+                    test_left[label] -= take
+                
+                for split, mask in (('train', ~is_test), ('test', is_test)):
+                    idx = np.flatnonzero(mask)
+                    split_tokens, split_offsets = take_ragged(token_ids, offsets, idx)
+                    writer.append(f'tokens_{split}', split_tokens)
+                    writer.append(f'offsets_{split}', split_offsets[1:] + token_base[split])
+                    token_base[split] += int(split_offsets[-1])
+                    for name, values in columns.items():
+                        writer.append(f'{name}_{split}', np.asarray(values)[idx])
+        
+        print(f"\nTrain samples: {writer.arrays['y_intent_train'].rows}")
+        print(f"Test samples: {writer.arrays['y_intent_test'].rows}")
     
     def save_encoders(self, path=BASE_DIR/'model_artifacts'):
-        """Save encoders and vocabulary"""
+        """
+        Save vocabulary and metadata
+        Label classes are stored as the *_classes lists of the metadata (see labels.py)
+        rather than pickled LabelEncoders, so inference never needs scikit-learn
+        """
         import os
         os.makedirs(path, exist_ok=True)
         
-        # Save encoders
-        with open(f'{path}/intent_encoder.pkl', 'wb') as f:
-            pickle.dump(self.intent_encoder, f)
-        with open(f'{path}/sub_intent_encoder.pkl', 'wb') as f:
-            pickle.dump(self.sub_intent_encoder, f)
-        with open(f'{path}/timeframe_encoder.pkl', 'wb') as f:
-            pickle.dump(self.timeframe_encoder, f)
-        with open(f'{path}/forecast_encoder.pkl', 'wb') as f:
-            pickle.dump(self.forecast_encoder, f)
-        
         # Save vocabulary
         with open(f'{path}/vocabulary.json', 'w') as f:
             json.dump(self.vocab, f, indent=2)
@@ -164,6 +386,7 @@ class IntentDataPreprocessor:
         metadata = {
             'vocab_size': self.vocab_size,
             'max_length': self.max_length,
+            'tokenizer': hash_spec(self.hash_buckets) if self.hash_buckets else {'type': 'vocabulary'},
             'intent_classes': self.intent_encoder.classes_.tolist(),
             'sub_intent_classes': self.sub_intent_encoder.classes_.tolist(),
             'timeframe_classes': self.timeframe_encoder.classes_.tolist(),
@@ -195,13 +418,39 @@ class IntentDataPreprocessor:
         with open(f'{path}/model_metadata.json', 'w') as f:
             json.dump(metadata, f, indent=2)
         
-        print(f"Saved encoders and metadata to {path}/")
+        print(f"Saved vocabulary and metadata to {path}/")
 
 if __name__ == "__main__":
-    preprocessor = IntentDataPreprocessor()
-    data = preprocessor.preprocess(BASE_DIR/'training_data.csv')
-    preprocessor.save_encoders()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Preprocess weather intent training data')
+    parser.add_argument('--input', type=str, default=None,
+                        help='Corpus directory or CSV (default: training_data/ if present, else training_data.csv)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Preprocess out of core, this many rows at a time (default: load everything)')
+    parser.add_argument('--max-length', type=int, default=None,
+                        help='Tokens kept per query (default: chosen from --length-percentile)')
+    parser.add_argument('--length-percentile', type=float, default=99.9,
+                        help='Percentile of query lengths used as max_length (default: 99.9)')
+    parser.add_argument('--hash-buckets', type=int, default=None,
+                        help='Hash words into this many embedding rows instead of building a vocabulary')
+    args = parser.parse_args()
     
-    # Save preprocessed data
-    np.savez(BASE_DIR/'preprocessed_data.npz', **data)
-    print("Saved preprocessed data to preprocessed_data.npz")
\ No newline at end of file
+    input_path = args.input
+    if input_path is None:
+        input_path = BASE_DIR/'training_data' if is_columnar(BASE_DIR/'training_data') else BASE_DIR/'training_data.csv'
+    
+    preprocessor = IntentDataPreprocessor(
+        max_length=args.max_length,
+        length_percentile=args.length_percentile,
+        hash_buckets=args.hash_buckets
+    )
+    if args.chunk_size:
+        # Arrays are appended to preprocessed_data/ chunk by chunk
+        preprocessor.preprocess_streaming(input_path, BASE_DIR/'preprocessed_data', args.chunk_size)
+    else:
+        data = preprocessor.preprocess(input_path)
+        # Save preprocessed data (one .npy per array, memory-mapped by train.py)
+        save_arrays(BASE_DIR/'preprocessed_data', data)
+    preprocessor.save_encoders()
+    print("Saved preprocessed data to preprocessed_data/")
\ No newline at end of file
@@ -1,12 +1,10 @@
-import torch
 import numpy as np
 import json
-import pickle
 import pendulum
 from colorama import init, Fore, Back, Style
-import onnxruntime as ort
-from model import create_model
-from config import BASE_DIR
+from config import BASE_DIR, MODEL_CHECKPOINT
+from labels import load_label_indexes
+from tokens import token_lookup
 
 # Initialize colorama for cross-platform colored output
 init(autoreset=True)
@@ -19,6 +17,7 @@ class InteractiveModelTester:
         self.vocabulary = {}
         self.metadata = {}
         self.encoders = {}
+        self.token_id = None
         
         print(f"{Fore.CYAN}{'='*70}")
         print(f"{Fore.CYAN}🧪 Interactive Weather Intent Model Tester v2.0")
@@ -41,21 +40,18 @@ class InteractiveModelTester:
                 self.metadata = json.load(f)
             print(f"{Fore.GREEN}✓ Metadata loaded")
             
-            # Load encoders
-            print(f"{Fore.YELLOW}Loading encoders...")
-            with open(BASE_DIR/'model_artifacts/intent_encoder.pkl', 'rb') as f:
-                self.encoders['intent'] = pickle.load(f)
-            with open(BASE_DIR/'model_artifacts/sub_intent_encoder.pkl', 'rb') as f:
-                self.encoders['sub_intent'] = pickle.load(f)
-            with open(BASE_DIR/'model_artifacts/timeframe_encoder.pkl', 'rb') as f:
-                self.encoders['timeframe'] = pickle.load(f)
-            with open(BASE_DIR/'model_artifacts/forecast_encoder.pkl', 'rb') as f:
-                self.encoders['forecast'] = pickle.load(f)
-            print(f"{Fore.GREEN}✓ Encoders loaded")
+            # Vocabulary lookup, or the hashed buckets the model was trained with
+            self.token_id = token_lookup(self.metadata, self.vocabulary)
             
+            # Label classes come from the metadata
+            self.encoders = load_label_indexes(self.metadata)
+            print(f"{Fore.GREEN}✓ Label classes loaded")
+            
+            # Only the selected runtime is imported
             if self.use_onnx:
                 # Load ONNX model
                 print(f"{Fore.YELLOW}Loading ONNX model...")
+                import onnxruntime as ort
                 self.session = ort.InferenceSession(
                     BASE_DIR/'model_artifacts/intent_model.onnx',
                     providers=['CPUExecutionProvider']
@@ -64,14 +60,9 @@ class InteractiveModelTester:
             else:
                 # Load PyTorch model
                 print(f"{Fore.YELLOW}Loading PyTorch model...")
-                self.model = create_model(
-                    vocab_size=self.metadata['vocab_size'],
-                    num_intent=len(self.metadata['intent_classes']),
-                    num_sub_intent=len(self.metadata['sub_intent_classes']),
-                    num_timeframe=len(self.metadata['timeframe_classes']),
-                    num_forecast=len(self.metadata['forecast_classes'])
-                )
-                self.model.load_state_dict(torch.load('best_model.pt', map_location='cpu'))
+                from model import load_model, apply_embedding_storage
+                self.model = load_model(MODEL_CHECKPOINT, self.metadata)
+                apply_embedding_storage(self.model)
                 self.model.eval()
                 print(f"{Fore.GREEN}✓ PyTorch model loaded")
                 
@@ -90,7 +81,7 @@ class InteractiveModelTester:
         max_length = self.metadata['max_length']
         
         # Convert to indices
-        indices = [self.vocabulary.get(token, 1) for token in tokens]  # 1 = UNK
+        indices = [self.token_id(token) for token in tokens]
         
         # Pad or truncate
         if len(indices) < max_length:
@@ -165,6 +156,7 @@ class InteractiveModelTester:
             
         else:
             # PyTorch inference
+            import torch
             input_tensor = torch.LongTensor([input_ids])
             
             with torch.no_grad():
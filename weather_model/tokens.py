@@ -0,0 +1,38 @@
+# intent_model/tokens.py
+"""
+Word -> token id lookup shared by preprocessing and inference
+
+Ids 0 and 1 are reserved for <PAD> and <UNK>. A 'vocabulary' tokenizer maps words through
+vocabulary.json; a 'hash' tokenizer maps every word, seen or not, to one of a fixed number
+of buckets by its FNV-1a hash, so the embedding table does not grow with the data. The
+tokenizer spec is stored under 'tokenizer' in model_metadata.json.
+"""
+
+PAD_ID = 0
+UNK_ID = 1
+HASH_OFFSET = 2  # hashed ids start after the reserved ids
+
+FNV_OFFSET_BASIS = 0x811C9DC5
+FNV_PRIME = 0x01000193
+
+def fnv1a_32(word: str) -> int:
+    """32-bit FNV-1a hash of the word's UTF-8 bytes (app/model/model.ts computes the same)"""
+    h = FNV_OFFSET_BASIS
+    for byte in word.encode('utf-8'):
+        h = ((h ^ byte) * FNV_PRIME) & 0xFFFFFFFF
+    return h
+
+def hash_token(word: str, buckets: int) -> int:
+    return HASH_OFFSET + fnv1a_32(word) % buckets
+
+def hash_spec(buckets: int) -> dict:
+    """Metadata entry of a hash tokenizer"""
+    return {'type': 'hash', 'hash': 'fnv1a32', 'buckets': buckets, 'offset': HASH_OFFSET}
+
+def token_lookup(metadata: dict, vocabulary: dict):
+    """word -> id function for the tokenizer recorded in metadata (vocabulary when absent)"""
+    spec = metadata.get('tokenizer', {'type': 'vocabulary'})
+    if spec['type'] == 'hash':
+        buckets = spec['buckets']
+        return lambda word: hash_token(word, buckets)
+    return lambda word: vocabulary.get(word, UNK_ID)
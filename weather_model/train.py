@@ -1,18 +1,235 @@
+import argparse
+import json
+import math
+import os
+import socket
+import time
+from pathlib import Path
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.optim as optim
-from torch.utils.data import TensorDataset, DataLoader
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler
 import numpy as np
-import json
-from model import create_model, IntentLoss
-from sklearn.metrics import accuracy_score, mean_absolute_error
+from model import create_model, apply_embedding_storage, IntentLoss
 import matplotlib.pyplot as plt
-from config import BASE_DIR
+from config import BASE_DIR, MODEL_CHECKPOINT, EMBEDDING_STORAGE
+from columnar import load_arrays, pad_ragged
+
+# Dataset arrays of the targets
+LABEL_COLUMNS = ['y_intent', 'y_sub_intent', 'y_timeframe', 'y_forecast']
+TEMPORAL_COLUMNS = ['y_day_offset', 'y_hour_of_day', 'y_day_duration', 'y_hour_duration']
+
+# Heads scored by evaluate: accuracy per classification head, MAE per temporal output
+CLASSIFICATION_HEADS = IntentLoss.CLASSIFICATION_HEADS
+TEMPORAL_OUTPUTS = [name[2:] for name in TEMPORAL_COLUMNS]
+
+# Columns of a packed [rows, len(TARGETS)] float32 target matrix (class ids are exact in float32)
+TARGETS = [name[2:] for name in LABEL_COLUMNS] + TEMPORAL_OUTPUTS + ['weight']
+
+def unpack_targets(packed):
+    """The target dict IntentLoss expects, from a packed target matrix (class ids as int64)"""
+    labels = packed[:, :len(LABEL_COLUMNS)].long().unbind(1)
+    return dict(zip(TARGETS, labels + packed[:, len(LABEL_COLUMNS):].unbind(1)))
+
+class IntentDataset(Dataset):
+    """
+    One split of a preprocessed dataset, read straight from memory-mapped columns
+    
+    Indexed with a list of row indices (use with a BatchSampler and batch_size=None), so a
+    batch is one fancy-index per column instead of per-row lookups and a collate step.
+    Queries are stored ragged and padded to the longest query in the batch; temporal
+    targets are stored as raw integers and divided by their range from scales.
+    A batch is (X, lengths, targets), targets being the dict of unpack_targets.
+    """
+    def __init__(self, arrays: dict, split: str, scales: dict):
+        self.tokens = arrays[f'tokens_{split}']
+        self.offsets = arrays[f'offsets_{split}']
+        self.labels = [arrays[f'{name}_{split}'] for name in LABEL_COLUMNS]
+        self.temporal = [(arrays[f'{name}_{split}'], scales[name[2:]]) for name in TEMPORAL_COLUMNS]
+        self.sample_weight = arrays[f'sample_weight_{split}']
+        self.lengths = np.diff(self.offsets)
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, indices):
+        # Sorted indices turn the gather into a forward scan over the mapped pages
+        indices = np.sort(np.asarray(indices))
+        X = torch.from_numpy(pad_ragged(self.tokens, self.offsets, indices))
+        lengths = torch.from_numpy(self.lengths[indices].astype(np.int64))
+        return X, lengths, unpack_targets(torch.from_numpy(self.packed_targets(indices)))
+    
+    def packed_targets(self, indices=slice(None)) -> np.ndarray:
+        """[rows, len(TARGETS)] float32 matrix of the targets of the given rows (all by default)"""
+        packed = np.empty((len(self.lengths[indices]), len(TARGETS)), dtype=np.float32)
+        for i, column in enumerate(self.labels):
+            packed[:, i] = column[indices]
+        for i, (column, scale) in enumerate(self.temporal, start=len(self.labels)):
+            packed[:, i] = np.minimum(column[indices] / np.float32(scale), 1.0, dtype=np.float32)
+        packed[:, -1] = self.sample_weight[indices]
+        return packed
+
+class PackedBatchLoader:
+    """
+    In-memory loader over an IntentDataset: the split is read once into a padded token
+    matrix, a lengths vector and one packed target matrix
+    
+    Each epoch gathers all three once, in the order of the batch sampler's batches (so length
+    bucketing, shuffling and data-parallel sharding all come from the sampler), which makes
+    every batch a contiguous slice. Yields the same (X, lengths, targets) batches as the
+    dataset, with X cut to the batch's longest query and targets as views of the slice.
+    """
+    def __init__(self, dataset: IntentDataset, batch_sampler):
+        self.batch_sampler = batch_sampler
+        # Tokens keep a narrow dtype in memory and are widened one batch at a time
+        token_dtype = np.promote_types(dataset.tokens.dtype, np.int16)
+        self.tokens = torch.from_numpy(pad_ragged(dataset.tokens, dataset.offsets, dtype=token_dtype))
+        self.lengths = torch.from_numpy(dataset.lengths.astype(np.int64))
+        self.targets = torch.from_numpy(dataset.packed_targets())
+    
+    def __len__(self):
+        return len(self.batch_sampler)
+    
+    def __iter__(self):
+        batches = [np.asarray(batch, dtype=np.int64) for batch in self.batch_sampler]
+        if not batches:
+            return
+        order = torch.from_numpy(np.concatenate(batches))
+        bounds = np.cumsum([0] + [len(batch) for batch in batches]).tolist()
+        
+        tokens = self.tokens[order]
+        lengths = self.lengths[order]
+        targets = self.targets[order]
+        widths = np.maximum.reduceat(lengths.numpy(), bounds[:-1]).clip(min=1).tolist()
+        for start, stop, width in zip(bounds[:-1], bounds[1:], widths):
+            yield tokens[start:stop, :width].long(), lengths[start:stop], unpack_targets(targets[start:stop])
+
+class LengthBucketBatchSampler:
+    """
+    Batches of similar-length queries, so padding each batch to its longest query wastes little
+    
+    Every epoch shuffles the rows, sorts pools of bucket_size rows by length, cuts each pool
+    into batches and shuffles the batch order. With shuffle=False the rows keep their order
+    before pooling and the batches are yielded in order (for evaluation).
+    """
+    def __init__(self, lengths, batch_size, bucket_size=None, shuffle=True, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        # Pools are whole batches, so only the last pool can end in a short batch
+        bucket_size = bucket_size or batch_size * 100
+        self.bucket_size = math.ceil(bucket_size / batch_size) * batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+    
+    def __len__(self):
+        return math.ceil(len(self.lengths) / self.batch_size)
+    
+    def __iter__(self):
+        rng = np.random.default_rng((self.seed, self.epoch))
+        self.epoch += 1
+        
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            pool = order[start:start + self.bucket_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='stable')]
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+        
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        for batch in batches:
+            yield batch.tolist()
+
+class ShardedBatchSampler:
+    """
+    One data-parallel rank's share of a batch sampler: every world_size-th batch, from rank
+    
+    The wrapped sampler must yield the same batches on every rank (seeded shuffles). Batches
+    past the last full round are dropped, so all ranks take the same number of steps.
+    """
+    def __init__(self, batch_sampler, rank, world_size):
+        self.batch_sampler = batch_sampler
+        self.rank = rank
+        self.world_size = world_size
+    
+    def __len__(self):
+        return len(self.batch_sampler) // self.world_size
+    
+    def __iter__(self):
+        steps = len(self) * self.world_size
+        for index, batch in enumerate(self.batch_sampler):
+            if index >= steps:
+                break
+            if index % self.world_size == self.rank:
+                yield batch
+
+class CompileFallback:
+    """
+    Call a module through torch.compile(dynamic=True), or eagerly if compiling fails
+    
+    dynamic=True compiles shape-generic kernels, so length-bucketed batches of varying
+    width do not each trigger a recompile. Compilation happens on the first calls, so a
+    failure surfaces there: it is reported once and the module runs eagerly from then on.
+    The backward graph may only be compiled inside loss.backward(), outside this wrapper;
+    IntentTrainer.train_epoch catches that case and disables compilation for every module.
+    """
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.compiled = None
+        try:
+            self.compiled = torch.compile(module, dynamic=True)
+        except Exception as e:  # torch.compile missing or unsupported on this platform
+            self.fall_back(e)
+    
+    def fall_back(self, error):
+        print(f"torch.compile failed for the {self.name} ({type(error).__name__}: {error}); running eager")
+        self.compiled = None
+    
+    def __call__(self, *args, **kwargs):
+        if self.compiled is not None:
+            try:
+                return self.compiled(*args, **kwargs)
+            except Exception as e:
+                self.fall_back(e)
+        return self.module(*args, **kwargs)
+
+# Training precisions: autocast dtype of the model's forward pass (None = plain float32)
+PRECISIONS = {'fp32': None, 'bf16': torch.bfloat16}
 
 class IntentTrainer:
-    def __init__(self, model, device='cpu'):
+    """
+    Trains and evaluates a model; with world_size > 1 it is one rank of a data-parallel run
+    
+    Each rank trains on its shard of the batches (see ShardedBatchSampler) with gradients
+    all-reduced by DistributedDataParallel. Rank 0 alone evaluates, checkpoints and decides
+    on early stopping, and broadcasts the validation loss and stop flag to the other ranks.
+    
+    compile_model=True runs the model and loss through torch.compile (see CompileFallback).
+    """
+    def __init__(self, model, device='cpu', checkpoint_path=MODEL_CHECKPOINT, precision='fp32',
+                 rank=0, world_size=1, compile_model=False):
         self.model = model.to(device)
         self.device = device
+        self.checkpoint_path = checkpoint_path
+        self.precision = precision
+        self.autocast_dtype = PRECISIONS[precision]
+        self.rank = rank
+        self.world_size = world_size
+        self.is_main = rank == 0
+        # Called by forward(): training steps go through DDP (gradient all-reduce),
+        # evaluation runs on rank 0 alone
+        self.train_model = DistributedDataParallel(self.model) if world_size > 1 else self.model
+        self.eval_model = self.model
         self.criterion = IntentLoss()
+        self.compile_model = compile_model
+        if compile_model:
+            self.train_model = CompileFallback(self.train_model, 'training forward')
+            self.eval_model = CompileFallback(self.eval_model, 'evaluation forward')
+            self.criterion = CompileFallback(self.criterion, 'loss')
         self.optimizer = optim.AdamW(model.parameters(), lr=0.001, weight_decay=0.01)
         try:
             self.scheduler = optim.lr_scheduler.ReduceLROnPlateau(
@@ -30,147 +247,154 @@ class IntentTrainer:
             'timeframe_acc': [],
             'forecast_acc': [],
             'day_offset_mae': [],
-            'hour_of_day_mae': []
+            'hour_of_day_mae': [],
+            'day_duration_mae': [],
+            'hour_duration_mae': [],
+            'samples_per_sec': [],
+            'epoch_seconds': []
         }
         
+    def forward(self, X, lengths=None):
+        """
+        Model outputs for a batch; with precision='bf16' the forward pass runs under CPU/CUDA
+        autocast (matmuls, convolutions and the LSTM in bfloat16), but outputs are returned
+        as float32 so the losses and metrics are always computed in full precision
+        lengths: real query lengths of the batch (counted from the padding in X if not given)
+        """
+        model = self.train_model if self.model.training else self.eval_model
+        with torch.autocast(torch.device(self.device).type, dtype=self.autocast_dtype,
+                            enabled=self.autocast_dtype is not None):
+            outputs = model(X, lengths)
+        return {name: value.float() for name, value in outputs.items()}
+    
     def train_epoch(self, train_loader):
         self.model.train()
         total_loss = 0
+        samples = 0
+        start = time.perf_counter()
         
-        for batch_idx, (X, y_intent, y_sub, y_time, y_fore, y_day_off, y_hour, y_day_dur, y_hour_dur) in enumerate(train_loader):
+        for batch_idx, (X, lengths, targets) in enumerate(train_loader):
             X = X.to(self.device)
-            y_intent = y_intent.to(self.device)
-            y_sub = y_sub.to(self.device)
-            y_time = y_time.to(self.device)
-            y_fore = y_fore.to(self.device)
-            y_day_off = y_day_off.to(self.device)
-            y_hour = y_hour.to(self.device)
-            y_day_dur = y_day_dur.to(self.device)
-            y_hour_dur = y_hour_dur.to(self.device)
-            
-            self.optimizer.zero_grad()
-            
-            outputs = self.model(X)
-            
-            targets = {
-                'intent': y_intent,
-                'sub_intent': y_sub,
-                'timeframe': y_time,
-                'forecast': y_fore,
-                'day_offset': y_day_off,
-                'hour_of_day': y_hour,
-                'day_duration': y_day_dur,
-                'hour_duration': y_hour_dur
-            }
-            
-            losses = self.criterion(outputs, targets)
-            loss = losses['total']
+            lengths = lengths.to(self.device)
+            targets = {name: value.to(self.device) for name, value in targets.items()}
             
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
-            self.optimizer.step()
+            try:
+                loss = self.train_step(X, lengths, targets)
+            except Exception as e:
+                if not self.is_compiled():
+                    raise
+                # e.g. a backward compile failure raised lazily from loss.backward():
+                # redo the step eagerly (train_step starts by clearing the gradients)
+                self.disable_compile(e)
+                loss = self.train_step(X, lengths, targets)
             
             total_loss += loss.item()
+            samples += X.size(0)
             
-            if batch_idx % 50 == 0:
+            if batch_idx % 50 == 0 and self.is_main:
                 print(f"  Batch {batch_idx}/{len(train_loader)}, Loss: {loss.item():.4f}")
         
-        return total_loss / len(train_loader)
+        # Loss and throughput over all ranks
+        totals = torch.tensor([total_loss, len(train_loader), samples], dtype=torch.float64)
+        if self.world_size > 1:
+            dist.all_reduce(totals)
+        total_loss, batches, samples = totals.tolist()
+        self.history['samples_per_sec'].append(samples / (time.perf_counter() - start))
+        return total_loss / batches
+    
+    def train_step(self, X, lengths, targets):
+        """One optimizer step on a batch; returns the loss"""
+        self.optimizer.zero_grad()
+        
+        outputs = self.forward(X, lengths)
+        
+        losses = self.training_losses(X, outputs, targets)
+        loss = losses['total']
+        
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
+        self.optimizer.step()
+        return loss
+    
+    def is_compiled(self):
+        return self.compile_model and self.train_model.compiled is not None
+    
+    def disable_compile(self, error):
+        """Run the model and loss eagerly from now on, after a failure inside a compiled step"""
+        print(f"torch.compile failed in a training step ({type(error).__name__}: {error}); running eager")
+        for wrapper in (self.train_model, self.eval_model, self.criterion):
+            wrapper.compiled = None
+    
+    def training_losses(self, X, outputs, targets):
+        """Losses optimized by train_epoch (subclasses can add terms that need the inputs)"""
+        return self.criterion(outputs, targets)
     
     def evaluate(self, val_loader):
         self.model.eval()
-        total_loss = 0
+        total_loss = torch.zeros((), dtype=torch.float64, device=self.device)
         
-        all_intent_preds = []
-        all_intent_true = []
-        all_sub_intent_preds = []
-        all_sub_intent_true = []
-        all_timeframe_preds = []
-        all_timeframe_true = []
-        all_forecast_preds = []
-        all_forecast_true = []
-        all_day_offset_preds = []
-        all_day_offset_true = []
-        all_hour_of_day_preds = []
-        all_hour_of_day_true = []
+        # Running sums over the batches, weighted by occurrence counts and kept on the device:
+        # correct predictions per classification head, absolute errors per temporal output
+        correct = torch.zeros(len(CLASSIFICATION_HEADS), dtype=torch.float64, device=self.device)
+        abs_error = torch.zeros(len(TEMPORAL_OUTPUTS), dtype=torch.float64, device=self.device)
+        total_weight = torch.zeros((), dtype=torch.float64, device=self.device)
         
         with torch.no_grad():
-            for X, y_intent, y_sub, y_time, y_fore, y_day_off, y_hour, y_day_dur, y_hour_dur in val_loader:
+            for X, lengths, targets in val_loader:
                 X = X.to(self.device)
-                y_intent = y_intent.to(self.device)
-                y_sub = y_sub.to(self.device)
-                y_time = y_time.to(self.device)
-                y_fore = y_fore.to(self.device)
-                y_day_off = y_day_off.to(self.device)
-                y_hour = y_hour.to(self.device)
-                y_day_dur = y_day_dur.to(self.device)
-                y_hour_dur = y_hour_dur.to(self.device)
+                lengths = lengths.to(self.device)
+                targets = {name: value.to(self.device) for name, value in targets.items()}
+                weight = targets['weight']
                 
-                outputs = self.model(X)
-                
-                targets = {
-                    'intent': y_intent,
-                    'sub_intent': y_sub,
-                    'timeframe': y_time,
-                    'forecast': y_fore,
-                    'day_offset': y_day_off,
-                    'hour_of_day': y_hour,
-                    'day_duration': y_day_dur,
-                    'hour_duration': y_hour_dur
-                }
+                outputs = self.forward(X, lengths)
                 
                 losses = self.criterion(outputs, targets)
-                total_loss += losses['total'].item()
-                
-                # Collect predictions
-                all_intent_preds.extend(outputs['intent_logits'].argmax(dim=1).cpu().numpy())
-                all_intent_true.extend(y_intent.cpu().numpy())
+                total_loss += losses['total'].detach()
                 
-                all_sub_intent_preds.extend(outputs['sub_intent_logits'].argmax(dim=1).cpu().numpy())
-                all_sub_intent_true.extend(y_sub.cpu().numpy())
+                # Accumulate metrics
+                predictions = torch.stack([outputs[f'{head}_logits'].argmax(dim=1) for head in CLASSIFICATION_HEADS])
+                labels = torch.stack([targets[head] for head in CLASSIFICATION_HEADS])
+                correct += ((predictions == labels) * weight).sum(dim=1, dtype=torch.float64)
                 
-                all_timeframe_preds.extend(outputs['timeframe_logits'].argmax(dim=1).cpu().numpy())
-                all_timeframe_true.extend(y_time.cpu().numpy())
-                
-                all_forecast_preds.extend(outputs['forecast_logits'].argmax(dim=1).cpu().numpy())
-                all_forecast_true.extend(y_fore.cpu().numpy())
-                
-                all_day_offset_preds.extend(outputs['day_offset'].squeeze().cpu().numpy())
-                all_day_offset_true.extend(y_day_off.cpu().numpy())
-                
-                all_hour_of_day_preds.extend(outputs['hour_of_day'].squeeze().cpu().numpy())
-                all_hour_of_day_true.extend(y_hour.cpu().numpy())
-        
-        # Calculate metrics
-        intent_acc = accuracy_score(all_intent_true, all_intent_preds)
-        sub_intent_acc = accuracy_score(all_sub_intent_true, all_sub_intent_preds)
-        timeframe_acc = accuracy_score(all_timeframe_true, all_timeframe_preds)
-        forecast_acc = accuracy_score(all_forecast_true, all_forecast_preds)
-        day_offset_mae = mean_absolute_error(all_day_offset_true, all_day_offset_preds)
-        hour_of_day_mae = mean_absolute_error(all_hour_of_day_true, all_hour_of_day_preds)
+                values = torch.stack([outputs[name].squeeze(1) for name in TEMPORAL_OUTPUTS])
+                truth = torch.stack([targets[name] for name in TEMPORAL_OUTPUTS])
+                abs_error += ((values - truth).abs() * weight).sum(dim=1, dtype=torch.float64)
+                total_weight += weight.sum(dtype=torch.float64)
         
+        # Calculate metrics (weighted by occurrence counts)
+        accuracy = (correct / total_weight).tolist()
+        mae = (abs_error / total_weight).tolist()
         return {
-            'loss': total_loss / len(val_loader),
-            'intent_acc': intent_acc,
-            'sub_intent_acc': sub_intent_acc,
-            'timeframe_acc': timeframe_acc,
-            'forecast_acc': forecast_acc,
-            'day_offset_mae': day_offset_mae,
-            'hour_of_day_mae': hour_of_day_mae
+            'loss': total_loss.item() / len(val_loader),
+            **{f'{head}_acc': value for head, value in zip(CLASSIFICATION_HEADS, accuracy)},
+            **{f'{name}_mae': value for name, value in zip(TEMPORAL_OUTPUTS, mae)}
         }
     
     def train(self, train_loader, val_loader, epochs=50, early_stop_patience=7):
-        print(f"Training on device: {self.device}")
-        print(f"Model parameters: {sum(p.numel() for p in self.model.parameters()):,}")
+        if self.is_main:
+            print(f"Training on device: {self.device} ({self.precision}, {self.world_size} process(es)"
+                  f"{', compiled' if self.compile_model else ''})")
+            print(f"Model parameters: {sum(p.numel() for p in self.model.parameters()):,}")
         
         best_val_loss = float('inf')
         patience_counter = 0
         
         for epoch in range(epochs):
-            print(f"\nEpoch {epoch + 1}/{epochs}")
+            if self.is_main:
+                print(f"\nEpoch {epoch + 1}/{epochs}")
             
+            epoch_start = time.perf_counter()
             train_loss = self.train_epoch(train_loader)
+            if not self.is_main:
+                # Follow rank 0's validation loss (for the LR schedule) and stop decision
+                val_loss, stop = self.broadcast_decision()
+                self.scheduler.step(val_loss)
+                if stop:
+                    break
+                continue
+            
             val_metrics = self.evaluate(val_loader)
+            self.history['epoch_seconds'].append(time.perf_counter() - epoch_start)
             
             self.history['train_loss'].append(train_loss)
             self.history['val_loss'].append(val_metrics['loss'])
@@ -180,8 +404,11 @@ class IntentTrainer:
             self.history['forecast_acc'].append(val_metrics['forecast_acc'])
             self.history['day_offset_mae'].append(val_metrics['day_offset_mae'])
             self.history['hour_of_day_mae'].append(val_metrics['hour_of_day_mae'])
+            self.history['day_duration_mae'].append(val_metrics['day_duration_mae'])
+            self.history['hour_duration_mae'].append(val_metrics['hour_duration_mae'])
             
-            print(f"Train Loss: {train_loss:.4f}")
+            print(f"Train Loss: {train_loss:.4f} ({self.history['samples_per_sec'][-1]:.0f} samples/s, "
+                  f"epoch {self.history['epoch_seconds'][-1]:.1f}s)")
             print(f"Val Loss: {val_metrics['loss']:.4f}")
             print(f"Intent Acc: {val_metrics['intent_acc']:.4f}")
             print(f"Sub-Intent Acc: {val_metrics['sub_intent_acc']:.4f}")
@@ -189,25 +416,39 @@ class IntentTrainer:
             print(f"Forecast Acc: {val_metrics['forecast_acc']:.4f}")
             print(f"Day Offset MAE: {val_metrics['day_offset_mae']:.4f} (normalized)")
             print(f"Hour of Day MAE: {val_metrics['hour_of_day_mae']:.4f} (normalized)")
+            print(f"Day Duration MAE: {val_metrics['day_duration_mae']:.4f} (normalized)")
+            print(f"Hour Duration MAE: {val_metrics['hour_duration_mae']:.4f} (normalized)")
             
             # Learning rate scheduling
             self.scheduler.step(val_metrics['loss'])
             
             # Early stopping
+            stop = False
             if val_metrics['loss'] < best_val_loss:
                 best_val_loss = val_metrics['loss']
                 patience_counter = 0
-                torch.save(self.model.state_dict(), 'best_model.pt')
+                torch.save(self.model.state_dict(), self.checkpoint_path)
                 print("✓ Saved best model")
             else:
                 patience_counter += 1
                 if patience_counter >= early_stop_patience:
                     print(f"\nEarly stopping triggered after {epoch + 1} epochs")
-                    break
+                    stop = True
+            self.broadcast_decision(val_metrics['loss'], stop)
+            if stop:
+                break
         
-        # Load best model
-        self.model.load_state_dict(torch.load('best_model.pt'))
-        print("\nTraining completed!")
+        # Load best model (only rank 0 has evaluated and saved it)
+        if self.is_main:
+            self.model.load_state_dict(torch.load(self.checkpoint_path))
+            print("\nTraining completed!")
+    
+    def broadcast_decision(self, val_loss=0.0, stop=False):
+        """Send rank 0's (val_loss, stop) to every rank; a no-op returning them when not distributed"""
+        decision = torch.tensor([val_loss, float(stop)], dtype=torch.float64)
+        if self.world_size > 1:
+            dist.broadcast(decision, src=0)
+        return decision[0].item(), bool(decision[1].item())
         
     def plot_history(self):
         fig, axes = plt.subplots(2, 3, figsize=(18, 10))
@@ -244,62 +485,98 @@ class IntentTrainer:
         axes[1, 0].legend()
         axes[1, 0].grid(True)
         
-        # Day Offset MAE
-        axes[1, 1].plot(self.history['day_offset_mae'])
-        axes[1, 1].set_title('Day Offset MAE (normalized)')
+        # Day Offset & Day Duration MAE
+        axes[1, 1].plot(self.history['day_offset_mae'], label='Day Offset')
+        axes[1, 1].plot(self.history['day_duration_mae'], label='Day Duration')
+        axes[1, 1].set_title('Day Offset & Duration MAE (normalized)')
         axes[1, 1].set_xlabel('Epoch')
         axes[1, 1].set_ylabel('MAE')
+        axes[1, 1].legend()
         axes[1, 1].grid(True)
         
-        # Hour of Day MAE
-        axes[1, 2].plot(self.history['hour_of_day_mae'])
-        axes[1, 2].set_title('Hour of Day MAE (normalized)')
+        # Hour of Day & Hour Duration MAE
+        axes[1, 2].plot(self.history['hour_of_day_mae'], label='Hour of Day')
+        axes[1, 2].plot(self.history['hour_duration_mae'], label='Hour Duration')
+        axes[1, 2].set_title('Hour of Day & Duration MAE (normalized)')
         axes[1, 2].set_xlabel('Epoch')
         axes[1, 2].set_ylabel('MAE')
+        axes[1, 2].legend()
         axes[1, 2].grid(True)
         
         plt.tight_layout()
         plt.savefig('training_history.png', dpi=300)
         print("Saved training history plot to training_history.png")
 
-def main():
-    # Load preprocessed data
-    data = np.load(BASE_DIR/'preprocessed_data.npz')
-    
-    # Load metadata
-    with open(BASE_DIR/'model_artifacts/model_metadata.json', 'r') as f:
-        metadata = json.load(f)
+def add_data_arguments(parser):
+    """Dataset and loader flags shared by train.py and distill.py"""
+    parser.add_argument('--data', type=Path, default=BASE_DIR/'preprocessed_data',
+                        help='Preprocessed dataset directory written by preprocess_data.py')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--bucket-size', type=int, default=None,
+                        help='Rows sorted together by length before batching (default: 100 batches)')
+    parser.add_argument('--no-bucketing', action='store_true',
+                        help='Draw batches uniformly at random instead of by length')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read batches from the memory-mapped arrays instead of loading the splits into memory')
+    parser.add_argument('--num-workers', type=int, default=0,
+                        help='DataLoader worker processes with --stream (they share the memory-mapped columns)')
+
+def make_loaders(args, metadata, rank=0, world_size=1):
+    """
+    (train_loader, test_loader) over the preprocessed dataset in args.data
+    With world_size > 1 the train loader yields only this rank's shard of the batches
+    """
+    # Open preprocessed data (memory-mapped, nothing is read until a batch asks for it)
+    data = load_arrays(args.data, mmap_mode='r')
     
     # Create datasets
-    train_dataset = TensorDataset(
-        torch.LongTensor(data['X_train']),
-        torch.LongTensor(data['y_intent_train']),
-        torch.LongTensor(data['y_sub_intent_train']),
-        torch.LongTensor(data['y_timeframe_train']),
-        torch.LongTensor(data['y_forecast_train']),
-        torch.FloatTensor(data['y_day_offset_train']),
-        torch.FloatTensor(data['y_hour_of_day_train']),
-        torch.FloatTensor(data['y_day_duration_train']),
-        torch.FloatTensor(data['y_hour_duration_train'])
-    )
+    scales = {name: spec['range'][1] for name, spec in metadata['temporal_normalization'].items()}
+    train_dataset = IntentDataset(data, 'train', scales)
+    test_dataset = IntentDataset(data, 'test', scales)
     
-    test_dataset = TensorDataset(
-        torch.LongTensor(data['X_test']),
-        torch.LongTensor(data['y_intent_test']),
-        torch.LongTensor(data['y_sub_intent_test']),
-        torch.LongTensor(data['y_timeframe_test']),
-        torch.LongTensor(data['y_forecast_test']),
-        torch.FloatTensor(data['y_day_offset_test']),
-        torch.FloatTensor(data['y_hour_of_day_test']),
-        torch.FloatTensor(data['y_day_duration_test']),
-        torch.FloatTensor(data['y_hour_duration_test'])
-    )
+    # Create loaders: the samplers yield whole batches of indices. In memory, each batch is
+    # a slice of tensors gathered once per epoch; with --stream, each __getitem__ call
+    # gathers one batch from the memory-mapped columns. Batches are padded to their
+    # longest query either way; length bucketing keeps that padding small
+    if args.no_bucketing:
+        # Data-parallel ranks must draw the same batches before sharding them
+        generator = torch.Generator().manual_seed(0) if world_size > 1 else None
+        train_sampler = BatchSampler(RandomSampler(train_dataset, generator=generator), args.batch_size, drop_last=False)
+        test_sampler = BatchSampler(SequentialSampler(test_dataset), args.batch_size, drop_last=False)
+    else:
+        train_sampler = LengthBucketBatchSampler(train_dataset.lengths, args.batch_size, args.bucket_size)
+        test_sampler = LengthBucketBatchSampler(test_dataset.lengths, args.batch_size, args.bucket_size, shuffle=False)
+    if world_size > 1:
+        train_sampler = ShardedBatchSampler(train_sampler, rank, world_size)
+    
+    # Loading a split into memory copies it into each process, so data-parallel ranks
+    # stream their (per-epoch reshuffled) train shards from the shared memory map, and
+    # only rank 0, the one that evaluates, loads the test split
+    def loader(dataset, sampler, stream):
+        if stream:
+            return DataLoader(dataset, sampler=sampler, batch_size=None, num_workers=args.num_workers)
+        return PackedBatchLoader(dataset, sampler)
+    
+    train_loader = loader(train_dataset, train_sampler, args.stream or world_size > 1)
+    test_loader = loader(test_dataset, test_sampler, args.stream or rank > 0)
+    return train_loader, test_loader
+
+def free_port():
+    """A free local TCP port for the process group rendezvous"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run(rank, world_size, port, args, metadata):
+    """Train on one data-parallel rank (the whole run when world_size is 1)"""
+    if world_size > 1:
+        # CPU workers over gloo, each on its share of the cores
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+        dist.init_process_group('gloo', init_method=f'tcp://127.0.0.1:{port}', rank=rank, world_size=world_size)
     
-    # Create dataloaders
-    train_loader = DataLoader(train_dataset, batch_size=64, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=64, shuffle=False)
+    train_loader, test_loader = make_loaders(args, metadata, rank, world_size)
     
-    # Create model
+    # Create model (DDP copies rank 0's initial weights to the other ranks)
     model = create_model(
         vocab_size=metadata['vocab_size'],
         num_intent=len(metadata['intent_classes']),
@@ -309,17 +586,49 @@ def main():
     )
     
     # Train
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    trainer = IntentTrainer(model, device=device)
+    device = torch.device('cuda' if torch.cuda.is_available() and world_size == 1 else 'cpu')
+    trainer = IntentTrainer(model, device=device, precision=args.precision, rank=rank, world_size=world_size,
+                            compile_model=args.compile)
     trainer.train(train_loader, test_loader, epochs=50)
     
-    # Plot history
-    trainer.plot_history()
+    if rank == 0:
+        # Plot history
+        trainer.plot_history()
+        
+        # Final evaluation
+        print("\n=== Final Test Set Evaluation ===")
+        final_metrics = trainer.evaluate(test_loader)
+        print(json.dumps(final_metrics, indent=2))
+        
+        # Same evaluation with the embedding table stored the way it will be exported
+        if EMBEDDING_STORAGE != 'float32':
+            print(f"\n=== Final Test Set Evaluation ({EMBEDDING_STORAGE} embedding) ===")
+            apply_embedding_storage(model)
+            print(json.dumps(trainer.evaluate(test_loader), indent=2))
+    
+    if world_size > 1:
+        dist.destroy_process_group()
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the intent classifier')
+    add_data_arguments(parser)
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32',
+                        help='bf16: autocast the forward pass to bfloat16 (losses stay float32)')
+    parser.add_argument('--nproc', type=int, default=1,
+                        help='Data-parallel CPU worker processes (batch size is per process; '
+                             'training batches are streamed from the shared memory map)')
+    parser.add_argument('--compile', action='store_true',
+                        help='Run the model and loss through torch.compile (falls back to eager if unsupported)')
+    args = parser.parse_args()
+    
+    # Load metadata
+    with open(BASE_DIR/'model_artifacts/model_metadata.json', 'r') as f:
+        metadata = json.load(f)
     
-    # Final evaluation
-    print("\n=== Final Test Set Evaluation ===")
-    final_metrics = trainer.evaluate(test_loader)
-    print(json.dumps(final_metrics, indent=2))
+    if args.nproc > 1:
+        mp.spawn(run, args=(args.nproc, free_port(), args, metadata), nprocs=args.nproc)
+    else:
+        run(0, 1, None, args, metadata)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()